@@ -1,314 +1,3523 @@
-#!/usr/bin/env python3
-"""
-Python AST to safely evaluate expressions (no eval/exec or attributes)
-"""
-
-from __future__ import annotations
-import ast
-import math
-from typing import Any, Dict, Callable
-
-# ---------------- SAFE EVALUATOR ---------------- #
-
-class SafeEval(ast.NodeVisitor):
-    def __init__(self, names: Dict[str, Any], funcs: Dict[str, Callable[..., float]]):
-        self.names = names
-        self.funcs = funcs
-
-    def visit_Expression(self, node):  # type: ignore[override]
-        return self.visit(node.body)
-
-    # Py<3.8
-    def visit_Num(self, node):  # type: ignore[override]
-        return node.n
-
-    # Py3.8+
-    def visit_Constant(self, node):  # type: ignore[override]
-        if isinstance(node.value, (int, float)):
-            return float(node.value)
-        raise ValueError("Only numeric constants allowed.")
-
-    def visit_Name(self, node):  # type: ignore[override]
-        if node.id in self.names:
-            return self.names[node.id]
-        raise NameError(f"Unknown name: {node.id}")
-
-    def visit_UnaryOp(self, node):  # type: ignore[override]
-        v = self.visit(node.operand)
-        if isinstance(node.op, ast.UAdd):  return +v
-        if isinstance(node.op, ast.USub):  return -v
-        raise ValueError("Unsupported unary operator.")
-
-    def visit_BinOp(self, node):  # type: ignore[override]
-        left = self.visit(node.left)
-        right = self.visit(node.right)
-        op = node.op
-        if isinstance(op, ast.Add):       return left + right
-        if isinstance(op, ast.Sub):       return left - right
-        if isinstance(op, ast.Mult):      return left * right
-        if isinstance(op, ast.Div):       return left / right
-        if isinstance(op, ast.FloorDiv):  return left // right
-        if isinstance(op, ast.Mod):       return left % right
-        if isinstance(op, ast.Pow):       return left ** right
-        raise ValueError("Unsupported binary operator.")
-
-    def visit_Call(self, node):  # type: ignore[override]
-        # Only allow simple function names, no attributes (e.g., math.sin is blocked)
-        if not isinstance(node.func, ast.Name):
-            raise ValueError("Only simple function calls allowed.")
-        fname = node.func.id
-        if fname not in self.funcs:
-            raise NameError(f"Unknown function: {fname}")
-        if node.keywords:
-            raise ValueError("Keyword arguments are not allowed.")
-        args = [self.visit(a) for a in node.args]
-        return self.funcs[fname](*args)
-
-    def generic_visit(self, node):  # type: ignore[override]
-        raise ValueError(f"Disallowed expression: {type(node).__name__}")
-
-def safe_eval(expr: str, names: Dict[str, Any], funcs: Dict[str, Callable[..., float]]) -> float:
-    expr = preprocess(expr)
-    tree = ast.parse(expr, mode='eval')
-    return SafeEval(names, funcs).visit(tree)
-
-# ---------------- PREPROCESSING ---------------- #
-
-def preprocess(expr: str) -> str:
-    s = expr.strip()
-    # Alias ^ to **
-    s = s.replace("^", "**")
-    # Alias ln(x) -> log(x) (natural log)
-    s = s.replace("ln(", "log(").replace("LN(", "log(")
-
-    # Case-insensitive references to ans/mem
-    s = replace_name_case_insensitive(s, "ans")
-    s = replace_name_case_insensitive(s, "mem")
-
-    # Expand factorial postfix: 5! -> factorial(5), (3+2)! -> factorial((3+2)), ans! -> factorial(ans)
-    s = expand_factorials(s)
-    return s
-
-def replace_name_case_insensitive(s: str, name: str) -> str:
-    import re
-    pattern = re.compile(rf"\b{name}\b", re.IGNORECASE)
-    return pattern.sub(name, s)
-
-def expand_factorials(s: str) -> str:
-    import re
-    # Matches: ( ... )!  OR  word!  OR  number!
-    token = r"(?:\([^()]*\)|[A-Za-z_]\w*|\d+(?:\.\d+)?)"
-    pattern = re.compile(rf"({token})!")
-    # Apply repeatedly until no more replacements
-    prev = None
-    out = s
-    while out != prev:
-        prev = out
-        out = pattern.sub(r"factorial(\1)", out)
-    return out
-
-# ---------------- TRIG MODE WRAPPERS ---------------- #
-
-class TrigMode:
-    def __init__(self, mode: str = "rad"):
-        self.mode = mode  # 'rad' or 'deg'
-    def set_mode(self, mode: str):
-        m = mode.lower()
-        if m not in ("rad", "deg"):
-            raise ValueError("Mode must be 'rad' or 'deg'.")
-        self.mode = m
-
-    def wrap_trig(self, f: Callable[[float], float]) -> Callable[[float], float]:
-        if self.mode == "rad":
-            return f
-        def g(x: float) -> float:
-            return f(math.radians(x))
-        return g
-
-    def wrap_atrig(self, f: Callable[[float], float]) -> Callable[[float], float]:
-        if self.mode == "rad":
-            return f
-        def g(x: float) -> float:
-            return math.degrees(f(x))
-        return g
-
-# ---------------- MAIN PROGRAM ---------------- #
-
-def build_env(trig: TrigMode, ans: float, mem: float):
-    # names (constants + variables)
-    names = {
-        "pi": math.pi, "e": math.e, "tau": math.tau,
-        "inf": math.inf, "nan": math.nan,
-        "ans": ans, "mem": mem,
-    }
-
-    # functions
-    funcs: Dict[str, Callable[..., float]] = {
-        # basic math
-        "abs": abs, "round": round,
-        "floor": math.floor, "ceil": math.ceil,
-        "sqrt": math.sqrt, "exp": math.exp,
-        "log": math.log, "log10": math.log10,
-
-        # trig (respect mode)
-        "sin": trig.wrap_trig(math.sin),
-        "cos": trig.wrap_trig(math.cos),
-        "tan": trig.wrap_trig(math.tan),
-        "asin": trig.wrap_atrig(math.asin),
-        "acos": trig.wrap_atrig(math.acos),
-        "atan": trig.wrap_atrig(math.atan),
-
-        # factorial (integer-like only)
-        "factorial": factorial_safe,
-    }
-    return names, funcs
-
-def factorial_safe(x: float) -> float:
-    # Allow non-negative integers or floats very close to ints
-    n = int(round(x))
-    if abs(x - n) > 1e-12 or n < 0:
-        raise ValueError("factorial() only defined for non-negative integers.")
-    return float(math.factorial(n))
-
-def print_help():
-    msg = """
-Commands:
-  help             Show this help
-  history          Show recent results
-  clear            Clear the screen (prints blank lines)
-  mode deg|rad     Set trig mode (default: rad)
-  precision N      Set decimal precision for printing (default: 12)
-  m+ [x]           Add x (or ans if omitted) to memory
-  m- [x]           Subtract x (or ans if omitted) from memory
-  mr               Print memory value
-  mc               Clear memory (set to 0)
-  reset            Reset ans, mem, mode, precision, history
-  quit / exit      Leave the calculator
-
-Usage:
-  - Enter math expressions directly:
-      2+2, 2*(3+4)^2, 5!, sqrt(2), log(8,2), ln(5) -> use 'log(5)' for natural log
-      sin(30) with mode deg OR sin(pi/6) with mode rad
-  - Variables:
-      ans (last answer), mem (memory register)
-    """
-    print(msg.strip())
-
-def main():
-    trig = TrigMode("rad")
-    precision = 12
-    ans = 0.0
-    mem = 0.0
-    history = []  # list[(expr, result)]
-
-    def show_result(x: float):
-        # Nicely format floats; show integers without decimal when exact
-        if math.isfinite(x):
-            if abs(x - int(x)) < 10**(-precision):
-                print(int(round(x)))
-            else:
-                print(f"{x:.{precision}g}")
-        else:
-            print(x)
-
-    print("Advanced Calculator. Type 'help' for commands. Ctrl+C to exit.\n")
-
-    while True:
-        try:
-            line = input("> ").strip()
-        except (EOFError, KeyboardInterrupt):
-            print("\nBye.")
-            break
-
-        if not line:
-            continue
-
-        # Commands
-        lower = line.lower()
-        if lower in ("quit", "exit"):
-            print("Bye.")
-            break
-        if lower == "help":
-            print_help()
-            continue
-        if lower == "history":
-            if not history:
-                print("(no history)")
-            else:
-                for i, (e, r) in enumerate(history[-20:], 1):  # last 20
-                    print(f"{i:>2}: {e}  =  {r}")
-            continue
-        if lower.startswith("clear"):
-            print("\n" * 60)
-            continue
-        if lower.startswith("mode"):
-            parts = line.split()
-            if len(parts) != 2 or parts[1].lower() not in ("deg", "rad"):
-                print("Usage: mode deg|rad")
-                continue
-            trig.set_mode(parts[1].lower())
-            print(f"Trig mode set to {trig.mode}.")
-            continue
-        if lower.startswith("precision"):
-            parts = line.split()
-            if len(parts) != 2 or not parts[1].isdigit():
-                print("Usage: precision N")
-                continue
-            precision = max(1, min(50, int(parts[1])))
-            print(f"Precision set to {precision}.")
-            continue
-        if lower == "mr":
-            show_result(mem)
-            continue
-        if lower == "mc":
-            mem = 0.0
-            print("Memory cleared.")
-            continue
-        if lower.startswith("m+") or lower.startswith("m-"):
-            op = line[:2].lower()  # 'm+' or 'm-'
-            arg = line[2:].strip()
-            if arg == "":
-                delta = ans
-            else:
-                # Evaluate arg with current env
-                names, funcs = build_env(trig, ans, mem)
-                try:
-                    delta = float(safe_eval(arg, names, funcs))
-                except Exception as e:
-                    print(f"Memory op error: {e}")
-                    continue
-            if op == "m+":
-                mem += delta
-            else:
-                mem -= delta
-            print(f"Memory = {mem}")
-            continue
-        if lower == "reset":
-            trig = TrigMode("rad")
-            precision = 12
-            ans = 0.0
-            mem = 0.0
-            history.clear()
-            print("State reset.")
-            continue
-
-        # Evaluate math expression
-        names, funcs = build_env(trig, ans, mem)
-        try:
-            value = safe_eval(line, names, funcs)
-            if not isinstance(value, (int, float)):
-                raise ValueError("Expression did not produce a number.")
-            ans = float(value)
-            history.append((line, ans))
-            show_result(ans)
-        except ZeroDivisionError:
-            print("Error: division by zero.")
-        except OverflowError:
-            print("Error: numeric overflow.")
-        except Exception as e:
-            print(f"Error: {e}")
-
-if __name__ == "__main__":
-    main()
-
-
+#!/usr/bin/env python3
+"""
+Python AST to safely evaluate expressions (no eval/exec or attributes)
+"""
+
+from __future__ import annotations
+import ast
+import math
+import operator
+import re
+import cmath
+import contextlib
+import csv
+import decimal
+import fractions
+import itertools
+import signal
+import sys
+import time
+from contextvars import ContextVar
+from collections import OrderedDict
+from typing import Any, Dict, Callable, Iterable, NoReturn
+
+try:
+    import numpy as np
+except ImportError:  # optional: only needed by vector_eval
+    np = None  # type: ignore[assignment]
+
+# ---------------- SAFE EVALUATOR ---------------- #
+
+class SafeEval(ast.NodeVisitor):
+    """
+    Evaluates a tree by walking it, with the same rules as the Compiler.
+    Used for text evaluated once, where compiling would cost more than it
+    saves; with limits, every node visit ticks them.
+    """
+    def __init__(self, names: Dict[str, Any], funcs: Dict[str, Callable[..., float]],
+                 numbers: NumberMode | None = None, limits: Limits | None = None):
+        self.names = names
+        self.funcs = funcs
+        self.numbers = numbers or FLOAT_NUMBERS
+        self.tick = limits.tick if limits else None
+
+    def visit(self, node):
+        if self.tick is not None:
+            self.tick()
+        return getattr(self, "visit_" + node.__class__.__name__, self.generic_visit)(node)
+
+    def visit_Expression(self, node):  # type: ignore[override]
+        return self.visit(node.body)
+
+    # Py<3.8
+    def visit_Num(self, node):  # type: ignore[override]
+        return node.n
+
+    # Py3.8+
+    def visit_Constant(self, node):  # type: ignore[override]
+        if isinstance(node.value, complex) and not self.numbers.imaginary:
+            raise ValueError("Imaginary numbers need mode complex.")
+        if isinstance(node.value, (int, float, complex)):
+            return self.numbers.literal(node.value)
+        raise ValueError("Only numeric constants allowed.")
+
+    def visit_Name(self, node):  # type: ignore[override]
+        if node.id in self.names:
+            return self.names[node.id]
+        raise NameError(f"Unknown name: {node.id}")
+
+    def visit_UnaryOp(self, node):  # type: ignore[override]
+        op = UNARYOPS.get(type(node.op))
+        if op is None:
+            raise ValueError("Unsupported unary operator.")
+        return op(self.visit(node.operand))
+
+    def visit_BinOp(self, node):  # type: ignore[override]
+        # Same operator table and a!/b! shortcut as the Compiler, so both
+        # agree in every mode
+        op = self.numbers.binops.get(type(node.op))
+        if op is None:
+            raise ValueError("Unsupported binary operator.")
+        ratio = FACTORIAL_RATIOS.get(self.funcs.get("factorial"))
+        args = factorial_ratio_args(node) if ratio else None
+        if args:
+            return ratio(self.visit(args[0]), self.visit(args[1]))
+        return op(self.visit(node.left), self.visit(node.right))
+
+    def visit_Call(self, node):  # type: ignore[override]
+        # Only allow simple function names, no attributes (e.g., math.sin is blocked)
+        if not isinstance(node.func, ast.Name):
+            raise ValueError("Only simple function calls allowed.")
+        fname = node.func.id
+        if fname not in self.funcs:
+            raise NameError(f"Unknown function: {fname}")
+        if node.keywords:
+            raise ValueError("Keyword arguments are not allowed.")
+        args = [self.visit(a) for a in node.args]
+        return self.funcs[fname](*args)
+
+    def generic_visit(self, node):  # type: ignore[override]
+        raise ValueError(f"Disallowed expression: {type(node).__name__}")
+
+# ---------------- COMPILER ---------------- #
+
+def power(base: Any, exp: Any) -> Any:
+    # Big integer powers run where the active Limits can cancel them
+    if type(base) is int and type(exp) is int and exp > 1 and base not in (-1, 0, 1):
+        return run_limited(pow, base, exp, bits=exp * math.log2(abs(base)))
+    return base ** exp
+
+# Operator tables resolved once at compile time instead of per node visit
+BINOPS: Dict[type, Callable[[Any, Any], Any]] = {
+    ast.Add: operator.add, ast.Sub: operator.sub,
+    ast.Mult: operator.mul, ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv, ast.Mod: operator.mod,
+    ast.Pow: power,
+}
+UNARYOPS: Dict[type, Callable[[Any], Any]] = {
+    ast.UAdd: operator.pos, ast.USub: operator.neg,
+}
+
+def int_truediv(a: Any, b: Any) -> Any:
+    # Exact when an int divides an int evenly, otherwise the usual float quotient
+    if type(a) is int and type(b) is int and b and not a % b:
+        return a // b
+    return a / b
+
+def multiply(a: Any, b: Any) -> Any:
+    # Integer products are checked against the active size cap first
+    if type(a) is int and type(b) is int:
+        limits = active_limits.get()
+        if limits is not None:
+            limits.check_int_bits(a.bit_length() + b.bit_length())
+    return a * b
+
+INT_BINOPS: Dict[type, Callable[[Any, Any], Any]] = {
+    **BINOPS, ast.Mult: multiply, ast.Div: int_truediv,
+}
+
+class NumberMode:
+    """
+    How one number mode reads literals (`literal`) and stores results in
+    ans/mem (`store`, default the same), which operator table it compiles
+    against and which functions it swaps into the build_env table (a dict,
+    or a function of the TrigMode); `wrap` adapts the functions it does not
+    replace. With fold_names off, named
+    constants (pi, e, ...) are read from the environment instead of being
+    folded in as float literals. big_ints marks modes whose factorials build
+    exact integers. Modes that compute at a working precision supply the
+    decimal context and constant values for a number of digits. `refine`
+    names the mode that re-evaluates a result whose error bound is too wide
+    for the digits about to be printed. Only modes with `imaginary` set
+    accept imaginary literals (2j).
+    """
+    def __init__(self, name: str, literal: Callable[[Any], Any],
+                 binops: Dict[type, Callable[[Any, Any], Any]] = BINOPS,
+                 funcs: Dict[str, Callable[..., Any]] | Callable[[Any], Dict] | None = None,
+                 store: Callable[[Any], Any] | None = None, fold_names: bool = True,
+                 big_ints: bool = False, wrap: Callable[[Callable], Callable] | None = None,
+                 context: Callable[[int], decimal.Context] | None = None,
+                 constants: Callable[[int], Dict[str, Any]] | None = None,
+                 refine: str | None = None, imaginary: bool = False):
+        self.name = name
+        self.literal = literal
+        self.store = store or literal
+        self.binops = binops
+        self.funcs = funcs or {}
+        self.fold_names = fold_names
+        self.big_ints = big_ints
+        self.wrap = wrap
+        self.context = context
+        self.constants = constants
+        self.refine = refine
+        self.imaginary = imaginary
+
+    def is_exact_int(self, value: Any) -> bool:
+        return type(self.literal(value)) is int
+
+def int_literal(value: Any) -> Any:
+    return value if type(value) is int else float(value)
+
+FLOAT_NUMBERS = NumberMode("float", float)
+
+Compiled = Callable[[Dict[str, Any]], Any]
+
+class Compiler(ast.NodeVisitor):
+    """
+    Turns a tree into nested closures once, so evaluating it again is just
+    closure calls. Same rules as SafeEval; names are still read at call time.
+    """
+    def __init__(self, funcs: Dict[str, Callable[..., float]],
+                 shared: Dict[int, str] | None = None, limits: Limits | None = None,
+                 numbers: NumberMode | None = None):
+        self.funcs = funcs
+        self.numbers = numbers or FLOAT_NUMBERS
+        self.limits = limits        # when set, every node visit ticks it
+        self.shared = shared or {}  # id(node) -> slot name, see common_subexpressions
+        self.slots: list = []       # (slot name, closure), inner subtrees first
+        self._compiled_slots: set = set()
+
+    def compile(self, tree: ast.AST) -> Compiled:
+        body = self.visit(tree)
+        if not self.slots:
+            return body
+        slots = tuple(self.slots)
+        # Shared subtrees are evaluated once per call into a private scope
+        def run(names):
+            scope = dict(names)
+            for slot, f in slots:
+                scope[slot] = f(scope)
+            return body(scope)
+        return run
+
+    def visit(self, node):
+        slot = self.shared.get(id(node))
+        if slot is None:
+            return self._counted(super().visit(node))
+        if slot not in self._compiled_slots:
+            self._compiled_slots.add(slot)
+            self.slots.append((slot, self._counted(super().visit(node))))
+        return lambda names: names[slot]
+
+    def _counted(self, fn: Compiled) -> Compiled:
+        if self.limits is None:
+            return fn
+        tick = self.limits.tick
+        def counted(names):
+            tick()
+            return fn(names)
+        return counted
+
+    def visit_Expression(self, node):  # type: ignore[override]
+        return self.visit(node.body)
+
+    def visit_Constant(self, node):  # type: ignore[override]
+        if isinstance(node.value, complex) and not self.numbers.imaginary:
+            raise ValueError("Imaginary numbers need mode complex.")
+        if isinstance(node.value, (int, float, complex)):
+            v = self.numbers.literal(node.value)
+            return lambda names: v
+        raise ValueError("Only numeric constants allowed.")
+
+    def visit_Name(self, node):  # type: ignore[override]
+        name = node.id
+        def load(names):
+            try:
+                return names[name]
+            except KeyError:
+                raise NameError(f"Unknown name: {name}") from None
+        return load
+
+    def visit_UnaryOp(self, node):  # type: ignore[override]
+        op = UNARYOPS.get(type(node.op))
+        if op is None:
+            raise ValueError("Unsupported unary operator.")
+        operand = self.visit(node.operand)
+        return lambda names: op(operand(names))
+
+    def visit_BinOp(self, node):  # type: ignore[override]
+        op = self.numbers.binops.get(type(node.op))
+        if op is None:
+            raise ValueError("Unsupported binary operator.")
+        # factorial(a)/factorial(b) never builds either factorial
+        ratio = FACTORIAL_RATIOS.get(self.funcs.get("factorial"))
+        args = factorial_ratio_args(node) if ratio else None
+        if args:
+            a, b = map(self.visit, args)
+            return lambda names: ratio(a(names), b(names))
+        left = self.visit(node.left)
+        right = self.visit(node.right)
+        return lambda names: op(left(names), right(names))
+
+    def visit_Call(self, node):  # type: ignore[override]
+        if not isinstance(node.func, ast.Name):
+            raise ValueError("Only simple function calls allowed.")
+        fname = node.func.id
+        if fname not in self.funcs:
+            raise NameError(f"Unknown function: {fname}")
+        if node.keywords:
+            raise ValueError("Keyword arguments are not allowed.")
+        f = self.funcs[fname]
+        args = [self.visit(a) for a in node.args]
+        # Fixed arities avoid building an argument list per call
+        if len(args) == 1:
+            a, = args
+            return lambda names: f(a(names))
+        if len(args) == 2:
+            a, b = args
+            return lambda names: f(a(names), b(names))
+        return lambda names: f(*[a(names) for a in args])
+
+    def generic_visit(self, node):  # type: ignore[override]
+        raise ValueError(f"Disallowed expression: {type(node).__name__}")
+
+def compile_expr(tree: ast.AST, funcs: Dict[str, Callable[..., float]],
+                 constants: Dict[str, float] | None = None,
+                 limits: Limits | None = None, numbers: NumberMode | None = None) -> Compiled:
+    tree = fold_constants(tree, funcs, constants, numbers, limits)
+    return Compiler(funcs, common_subexpressions(tree), limits, numbers).compile(tree)
+
+def interpret_expr(tree: ast.AST, funcs: Dict[str, Callable[..., float]],
+                   limits: Limits | None = None, numbers: NumberMode | None = None) -> Compiled:
+    # Same signature of result as compile_expr, but walks the tree per call:
+    # no set-up cost, for text that is likely to run only once
+    return lambda names: SafeEval(names, funcs, numbers, limits).visit(tree)
+
+def common_subexpressions(tree: ast.AST) -> Dict[int, str]:
+    """
+    Map id(node) -> slot name for every operator or call subtree that occurs
+    more than once, structurally. Every function in the tables is pure, so a
+    repeated subtree can be evaluated once per evaluation and reused.
+    """
+    keys: Dict[tuple, int] = {}
+    node_keys: Dict[int, int] = {}
+    counts: Dict[int, int] = {}
+
+    def key(node) -> int:
+        if isinstance(node, ast.Expression):
+            return key(node.body)
+        if isinstance(node, ast.Constant):
+            # 0.0 == -0.0 but 1/0.0 != 1/-0.0, so floats are keyed by their text
+            value = node.value
+            k: tuple = ("const", type(value), repr(value) if isinstance(value, (float, complex)) else value)
+        elif isinstance(node, ast.Name):
+            k = ("name", node.id)
+        elif isinstance(node, ast.UnaryOp):
+            k = ("unary", type(node.op), key(node.operand))
+        elif isinstance(node, ast.BinOp):
+            k = ("binary", type(node.op), key(node.left), key(node.right))
+        elif isinstance(node, ast.Call) and isinstance(node.func, ast.Name):
+            k = ("call", node.func.id, tuple(key(a) for a in node.args))
+        else:
+            k = ("node", id(node))
+        index = keys.setdefault(k, len(keys))
+        if k[0] in ("unary", "binary", "call"):
+            node_keys[id(node)] = index
+            counts[index] = counts.get(index, 0) + 1
+        return index
+
+    key(tree)
+    return {nid: f"#{index}" for nid, index in node_keys.items() if counts[index] > 1}
+
+# ---------------- CONSTANT FOLDING ---------------- #
+
+CONSTANTS: Dict[str, float] = {
+    "pi": math.pi, "e": math.e, "tau": math.tau,
+    "inf": math.inf, "nan": math.nan,
+}
+
+_FOLD_WORK_LIMIT = 2.0 ** 16
+
+class ConstantFolder(ast.NodeVisitor):
+    """
+    Returns a copy of the tree with constant operators, constant names and
+    calls to pure functions folded into single constants. Subtrees that
+    raise (1/0, sqrt(-1), ...) are kept so the error surfaces on evaluation.
+    The input tree is never modified, so cached trees stay shareable.
+    Integers over the limits' size cap are not folded either.
+    """
+    def __init__(self, funcs: Dict[str, Callable[..., float]], constants: Dict[str, float],
+                 numbers: NumberMode, limits: Limits | None = None):
+        self.funcs = funcs
+        self.constants = constants
+        self.numbers = numbers
+        self.max_int_bits = limits.max_int_bits if limits else None
+
+    def fold(self, node: ast.expr, f: Callable[..., Any], operands: list) -> ast.expr:
+        # Constants are read exactly as the Compiler reads them
+        if not all(isinstance(a, ast.Constant) and isinstance(a.value, (int, float)) for a in operands):
+            return node
+        # Big factorials and powers are left for the evaluator's cost check;
+        # the operands are constants, so only the node itself can be costly
+        if builds_big_ints(node) and estimate_cost(node, {}, self.numbers) > _FOLD_WORK_LIMIT:
+            return node
+        try:
+            value = f(*[self.numbers.literal(a.value) for a in operands])
+        except Exception:
+            return node
+        # Results the number mode would convert (float mode: floor, round, ...)
+        # stay unfolded so their type is preserved
+        if not isinstance(value, (int, float)) or type(self.numbers.literal(value)) is not type(value):
+            return node
+        if self.max_int_bits is not None and type(value) is int and value.bit_length() > self.max_int_bits:
+            return node
+        return ast.Constant(value=value)
+
+    def visit_Expression(self, node):  # type: ignore[override]
+        return ast.Expression(body=self.visit(node.body))
+
+    def visit_Constant(self, node):  # type: ignore[override]
+        return node
+
+    def visit_Name(self, node):  # type: ignore[override]
+        if node.id in self.constants and self.numbers.fold_names:
+            return ast.Constant(value=self.constants[node.id])
+        return node
+
+    def visit_UnaryOp(self, node):  # type: ignore[override]
+        operand = self.visit(node.operand)
+        new = ast.UnaryOp(op=node.op, operand=operand)
+        op = UNARYOPS.get(type(node.op))
+        return self.fold(new, op, [operand]) if op else new
+
+    def visit_BinOp(self, node):  # type: ignore[override]
+        # factorial(a)/factorial(b) stays whole, with only a and b folded,
+        # so the evaluator's ratio shortcut still applies
+        args = factorial_ratio_args(node) if FACTORIAL_RATIOS.get(self.funcs.get("factorial")) else None
+        if args:
+            a, b = map(self.visit, args)
+            return ast.BinOp(left=_call("factorial", [a]), op=node.op, right=_call("factorial", [b]))
+        left = self.visit(node.left)
+        right = self.visit(node.right)
+        new = ast.BinOp(left=left, op=node.op, right=right)
+        op = self.numbers.binops.get(type(node.op))
+        return self.fold(new, op, [left, right]) if op else new
+
+    def visit_Call(self, node):  # type: ignore[override]
+        if not isinstance(node.func, ast.Name) or node.keywords:
+            return node
+        args = [self.visit(a) for a in node.args]
+        new = ast.Call(func=node.func, args=args, keywords=[])
+        f = self.funcs.get(node.func.id)
+        return self.fold(new, f, args) if f in PURE_FUNCS else new
+
+    def generic_visit(self, node):  # type: ignore[override]
+        return node
+
+def fold_constants(tree: ast.AST, funcs: Dict[str, Callable[..., float]],
+                   constants: Dict[str, float] | None = None,
+                   numbers: NumberMode | None = None, limits: Limits | None = None) -> ast.AST:
+    return ConstantFolder(funcs, CONSTANTS if constants is None else constants,
+                          numbers or FLOAT_NUMBERS, limits).visit(tree)
+
+def parse_expr(expr: str) -> ast.Expression:
+    return Parser(expr).parse()
+
+# ---------------- COST ESTIMATION ---------------- #
+
+# Work budget in bits of big-integer results; 2**24 bits is about 5M digits
+DEFAULT_COST_BUDGET = 2.0 ** 24
+_FLOAT_BITS = 1024.0  # a float result can never exceed 2**1024
+
+def _pow2(x: float) -> float:
+    # 2.0**x for a magnitude; 2.0**1024 itself overflows, so x is capped
+    return 2.0 ** min(x, _FLOAT_BITS - 1)
+
+class CostExceeded(ValueError):
+    pass
+
+class CostEstimator(ast.NodeVisitor):
+    """
+    Static upper bound on the work an expression can trigger. Each visit
+    returns (log2 of the largest possible magnitude, result is an int);
+    only exact integer steps (int powers, factorials) add to self.work,
+    measured in bits of the integers they build. Float steps overflow fast
+    and cost nothing here.
+    """
+    def __init__(self, names: Dict[str, Any], numbers: NumberMode | None = None):
+        self.names = names
+        self.numbers = numbers or FLOAT_NUMBERS
+        self.work = 0.0
+
+    @staticmethod
+    def magnitude(v: Any) -> float:
+        try:
+            if not v:
+                return 0.0
+            return math.log2(abs(v)) if isinstance(v, int) or math.isfinite(v) else _FLOAT_BITS
+        except (TypeError, ValueError):
+            return _FLOAT_BITS
+
+    def visit_Expression(self, node):  # type: ignore[override]
+        return self.visit(node.body)
+
+    def visit_Constant(self, node):  # type: ignore[override]
+        return self.magnitude(node.value), self.numbers.is_exact_int(node.value)
+
+    def visit_Name(self, node):  # type: ignore[override]
+        if node.id not in self.names:
+            raise NameError(f"Unknown name: {node.id}")
+        v = self.names[node.id]
+        return self.magnitude(v), isinstance(v, int)
+
+    def visit_UnaryOp(self, node):  # type: ignore[override]
+        return self.visit(node.operand)
+
+    def visit_BinOp(self, node):  # type: ignore[override]
+        ratio = self.factorial_ratio(node)
+        if ratio is not None:
+            return ratio
+        a, a_int = self.visit(node.left)
+        b, b_int = self.visit(node.right)
+        both = a_int and b_int
+        op = type(node.op)
+        if op in (ast.Add, ast.Sub):
+            mag = max(a, b) + 1
+        elif op is ast.Mult:
+            mag = a + b
+        elif op is ast.Pow:
+            mag = a * _pow2(b) if a > 0 else 1.0
+            if both:
+                self.work += mag
+        elif op is ast.Div:
+            if not (both and self.numbers.binops.get(ast.Div) is rational_truediv):
+                return _FLOAT_BITS, False
+            mag = a + b  # exact fraction: numerator and denominator together
+        else:  # FloorDiv, Mod
+            mag = a
+        return (mag, True) if both else (min(mag, _FLOAT_BITS), False)
+
+    def factorial_ratio(self, node) -> tuple | None:
+        # factorial(a)/factorial(b) costs only the product over the gap,
+        # when both arguments can be worked out up front
+        args = factorial_ratio_args(node)
+        if args is None:
+            return None
+        m, n = (static_value(a, self.names) for a in args)
+        try:
+            m, n = _factorial_arg(m), _factorial_arg(n)
+        except (TypeError, ValueError, OverflowError):
+            return None
+        if m is None or n is None:
+            return _FLOAT_BITS, False
+        bits = _ratio_bits(m, n)
+        if not self.numbers.big_ints:
+            return (min(bits, _FLOAT_BITS) if m >= n else 0.0), False
+        self.work += bits
+        return (bits, self.numbers.is_exact_int(0)) if m >= n else (0.0, False)
+
+    def visit_Call(self, node):  # type: ignore[override]
+        fname = node.func.id if isinstance(node.func, ast.Name) else ""
+        args = [self.visit(a) for a in node.args]
+        a = args[0][0] if args else 0.0
+        if fname in ("factorial", "factorial2") and not self.numbers.big_ints:
+            return _FLOAT_BITS, False  # float table lookup, or an immediate overflow
+        if fname in ("factorial", "factorial2"):
+            n = _pow2(a)
+            bits = n * max(math.log2(n) - 1.4427, 1.0)  # log2(n!) ~ n*(log2 n - log2 e)
+            bits = bits / 2 if fname == "factorial2" else bits
+            self.work += bits
+            return bits, self.numbers.is_exact_int(0)
+        if fname in ("floor", "ceil", "round"):
+            return a, True
+        if fname == "abs":
+            return a, args[0][1] if args else False
+        if fname == "sqrt":
+            return a / 2, False
+        if fname in ("sin", "cos"):
+            return 0.0, False
+        if fname in ("log", "log10", "asin", "acos", "atan"):
+            return math.log2(max(a, 2.0)) + 2, False
+        return _FLOAT_BITS, False
+
+    def generic_visit(self, node):  # type: ignore[override]
+        return _FLOAT_BITS, False
+
+def static_value(node: ast.AST, names: Dict[str, Any]) -> float | None:
+    # Float value of a subtree of constants, known names and operators, or
+    # None if it has calls or cannot be computed that way
+    try:
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)):
+            return float(node.value)
+        if isinstance(node, ast.Name):
+            return float(names[node.id])
+        if isinstance(node, ast.UnaryOp):
+            return UNARYOPS[type(node.op)](static_value(node.operand, names))
+        if isinstance(node, ast.BinOp):
+            return BINOPS[type(node.op)](static_value(node.left, names),
+                                         static_value(node.right, names))
+    except (KeyError, TypeError, ValueError, ArithmeticError):
+        pass
+    return None
+
+def estimate_cost(tree: ast.AST, names: Dict[str, Any],
+                  numbers: NumberMode | None = None) -> float:
+    v = CostEstimator(names, numbers)
+    v.visit(tree)
+    return v.work
+
+def builds_big_ints(node: ast.AST) -> bool:
+    # Only powers and factorials can build large integers
+    if isinstance(node, ast.BinOp):
+        return isinstance(node.op, ast.Pow)
+    return isinstance(node, ast.Call) and isinstance(node.func, ast.Name) \
+        and node.func.id in ("factorial", "factorial2")
+
+def scan_tree(tree: ast.AST) -> tuple:
+    # (may be expensive, names read) in one pass over a parsed tree;
+    # ast.walk is several times slower on trees this small
+    names: set = set()
+    big = False
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, ast.Name):
+            names.add(node.id)
+        elif isinstance(node, ast.BinOp):
+            big = big or isinstance(node.op, ast.Pow)
+            stack += (node.left, node.right)
+        elif isinstance(node, ast.UnaryOp):
+            stack.append(node.operand)
+        elif isinstance(node, ast.Call):
+            big = big or builds_big_ints(node)
+            stack += node.args
+        elif isinstance(node, ast.Expression):
+            stack.append(node.body)
+    return big, names
+
+def may_be_expensive(tree: ast.AST) -> bool:
+    return scan_tree(tree)[0]
+
+def check_cost(tree: ast.AST, names: Dict[str, Any], budget: float,
+               numbers: NumberMode | None = None):
+    check_work(estimate_cost(tree, names, numbers), budget)
+
+def check_work(work: float, budget: float):
+    if work > budget:
+        raise CostExceeded(f"expression too expensive (about {work:.3g} bits of work, budget {budget:.3g}).")
+
+# ---------------- LIMITS ---------------- #
+
+class LimitExceeded(Exception):
+    pass
+
+class MemoryLimitExceeded(LimitExceeded):
+    pass
+
+class Limits:
+    """
+    Per-evaluation budget on node visits and wall-clock time. Compiled code
+    ticks it once per node; big-integer builtins go through run_limited so
+    they run in a child process that can be killed at the deadline.
+    """
+    def __init__(self, max_steps: int | None = 1_000_000, timeout: float | None = 10.0,
+                 offload_bits: float = 1 << 20, max_int_bits: int | None = 1 << 27):
+        self.max_steps = max_steps
+        self.timeout = timeout
+        self.offload_bits = offload_bits  # smaller integer work stays in-process
+        self.max_int_bits = max_int_bits  # largest integer result allowed (2**27 bits = 16 MiB)
+        self.steps = 0
+        self.deadline = math.inf
+
+    def start(self):
+        self.steps = 0
+        self.deadline = math.inf if self.timeout is None else time.monotonic() + self.timeout
+
+    def tick(self):
+        self.steps += 1
+        if self.steps & 255 == 0:
+            # Checked every 256 steps; single slow builtins are run_limited's job
+            if self.max_steps is not None and self.steps > self.max_steps:
+                raise LimitExceeded(f"step limit exceeded ({self.max_steps} steps).")
+            self.check_time()
+
+    def check_time(self):
+        if time.monotonic() > self.deadline:
+            self.timed_out()
+
+    def remaining(self) -> float | None:
+        return None if self.deadline == math.inf else max(0.0, self.deadline - time.monotonic())
+
+    def timed_out(self):
+        raise LimitExceeded(f"time limit exceeded ({self.timeout:g} s).")
+
+    def check_int_bits(self, bits: float):
+        # Called before an integer of about `bits` bits is allocated
+        if self.max_int_bits is not None and bits > self.max_int_bits:
+            raise MemoryLimitExceeded(
+                f"integer result would need about {_format_bytes(bits / 8)} "
+                f"(limit {_format_bytes(self.max_int_bits / 8)}).")
+
+def _format_bytes(n: float) -> str:
+    for unit in ("bytes", "KiB", "MiB", "GiB", "TiB"):
+        if n < 1024 or unit == "TiB":
+            return f"{n:.0f} {unit}" if unit == "bytes" else f"{n:.1f} {unit}"
+        n /= 1024
+    return f"{n:.1f} TiB"
+
+# Limits of the evaluation running in the current thread, if any
+active_limits: ContextVar[Limits | None] = ContextVar("active_limits", default=None)
+
+def evaluate_limited(fn: Compiled, names: Dict[str, Any], limits: Limits) -> Any:
+    limits.start()
+    token = active_limits.set(limits)
+    try:
+        return fn(names)
+    finally:
+        active_limits.reset(token)
+
+def _limited_target(conn, fn: Callable[..., Any], args: tuple):
+    # Child side of run_limited; Ctrl+C is handled by the parent
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    try:
+        conn.send((True, fn(*args)))
+    except BaseException as e:
+        conn.send((False, e))
+    finally:
+        conn.close()
+
+def run_limited(fn: Callable[..., Any], *args: Any, bits: float = 0.0) -> Any:
+    """
+    Call fn(*args), which is expected to build an integer of about `bits`
+    bits. Results over the integer size cap fail before anything is
+    allocated. Small jobs, or calls outside a limited evaluation, run inline;
+    big ones run in a child process that is terminated at the deadline.
+    """
+    limits = active_limits.get()
+    if limits is None:
+        return fn(*args)
+    limits.check_int_bits(bits)
+    if bits < limits.offload_bits:
+        return fn(*args)
+    import multiprocessing
+    recv, send = multiprocessing.Pipe(duplex=False)
+    child = multiprocessing.Process(target=_limited_target, args=(send, fn, args), daemon=True)
+    child.start()
+    send.close()
+    try:
+        if not recv.poll(limits.remaining()):
+            limits.timed_out()
+        ok, value = recv.recv()
+    except EOFError:
+        raise LimitExceeded("computation was aborted.") from None
+    finally:
+        if child.is_alive():
+            child.terminate()
+        child.join()
+        recv.close()
+    if not ok:
+        raise value
+    return value
+
+# ---------------- EXPRESSION CACHE ---------------- #
+
+class ExprCache:
+    """
+    Size-bounded LRU map from raw expression text to load(text). With
+    `promote`, load is the cheap form and a key seen a second time is
+    reloaded once as promote(text), so text used only once never pays for
+    the expensive one.
+    """
+    def __init__(self, load: Callable[[str], Any], maxsize: int = 1024,
+                 promote: Callable[[str], Any] | None = None):
+        self.load = load
+        self.promote = promote
+        self.maxsize = maxsize
+        self.hits = self.misses = self.evictions = 0
+        self._data: OrderedDict[str, Any] = OrderedDict()
+        self._cheap: set = set()  # keys still holding load's value
+
+    def get(self, key: str) -> Any:
+        try:
+            value = self._data[key]
+        except KeyError:
+            self.misses += 1
+            value = self._data[key] = self.load(key)
+            if self.promote is not None:
+                self._cheap.add(key)
+            if len(self._data) > self.maxsize:
+                old, _ = self._data.popitem(last=False)
+                self._cheap.discard(old)
+                self.evictions += 1
+            return value
+        self.hits += 1
+        self._data.move_to_end(key)
+        if key in self._cheap:
+            self._cheap.discard(key)
+            value = self._data[key] = self.promote(key)  # type: ignore[misc]
+        return value
+
+    def clear(self):
+        self._data.clear()
+        self._cheap.clear()
+        self.hits = self.misses = self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def __str__(self):
+        return (f"{len(self)}/{self.maxsize} entries, {self.hits} hits, "
+                f"{self.misses} misses, {self.evictions} evictions")
+
+# Preprocessed, parsed and validated trees keyed by raw input
+expr_cache = ExprCache(parse_expr)
+
+# Evaluators for safe_eval, one cache per function table for the few most
+# recent tables. An entry holds its table, so the id key stays unique.
+_compiled_tables: OrderedDict[int, tuple] = OrderedDict()
+_COMPILED_TABLES = 8
+
+def safe_eval(expr: str, names: Dict[str, Any], funcs: Dict[str, Callable[..., float]]) -> float:
+    """
+    Evaluate expr against names and funcs. Parses are cached by text. Per
+    function table, an expression is walked on first use and compiled from
+    its second, so a fresh table from build_env on every call costs a tree
+    walk rather than a compile.
+    """
+    entry = _compiled_tables.get(id(funcs))
+    if entry is None:
+        cache = ExprCache(lambda text: interpret_expr(expr_cache.get(text), funcs),
+                          promote=lambda text: compile_expr(expr_cache.get(text), funcs))
+        entry = _compiled_tables[id(funcs)] = (funcs, cache)
+        if len(_compiled_tables) > _COMPILED_TABLES:
+            _compiled_tables.popitem(last=False)
+    else:
+        _compiled_tables.move_to_end(id(funcs))
+    return entry[1].get(expr)(names)
+
+# ---------------- PARSER ---------------- #
+
+_TOKEN_RE = re.compile(r"""
+    (?P<num>(?:\d(?:_?\d)*(?:\.(?:\d(?:_?\d)*)?)?|\.\d(?:_?\d)*)(?:[eE][+-]?\d(?:_?\d)*)?[jJ]?)
+  | (?P<name>[A-Za-z_]\w*)
+  | (?P<op>\*\*|//|!!|[-+*/%^()!,])
+  | (?P<bad>\S)
+""", re.VERBOSE)
+
+# Names folded to lower case
+_FOLDED_NAMES = {"ans": "ans", "mem": "mem"}
+_FOLDED_FUNCS = {"ln": "log"}
+
+# Infix binding powers; ** and ^ are right-associative
+_INFIX = {
+    "+": (10, ast.Add), "-": (10, ast.Sub),
+    "*": (20, ast.Mult), "/": (20, ast.Div), "//": (20, ast.FloorDiv), "%": (20, ast.Mod),
+    "**": (40, ast.Pow), "^": (40, ast.Pow),
+}
+_MUL_BP = 20
+_UNARY_BP = 30
+_POW_BP = 40
+
+class Literal(float):
+    """
+    A float literal that keeps the text it was typed as. It is a float
+    everywhere, but its repr is that text, so modes that read floats at
+    their decimal form (exact, decimal, adaptive) get every digit typed:
+    0.12345678901234567890123 is not cut to 17 digits, and 1e-400 and
+    1.5e400 are not 0 and inf.
+    """
+    __slots__ = ("text",)
+    text: str
+
+    def __new__(cls, text: str):
+        self = super().__new__(cls, text)
+        self.text = text
+        return self
+
+    def __repr__(self) -> str:
+        return self.text
+
+    def __getnewargs__(self):
+        return (self.text,)
+
+def tokenize(expr: str) -> list:
+    # (kind, text, position) triples, terminated by an "end" token
+    tokens = [(m.lastgroup, m.group(), m.start()) for m in _TOKEN_RE.finditer(expr)]
+    end = -1
+    for kind, text, pos in tokens:
+        if kind == "bad":
+            raise SyntaxError(f"Unexpected character '{text}' at position {pos}.")
+        # Digit separators follow Python: 1_000 is a number, 1_ and 1__0 are not
+        if kind == "name" and pos == end and text[0] == "_":
+            raise SyntaxError(f"Invalid number at position {pos}.")
+        end = pos + len(text) if kind == "num" else -1
+    tokens.append(("end", "", len(expr)))
+    return tokens
+
+class Parser:
+    """
+    Single-pass Pratt parser for the calculator grammar. Handles ^, ln,
+    case-insensitive ans/mem, postfix ! and !! and implicit multiplication (2pi,
+    3(4+1)) directly and emits the same node types SafeEval accepts.
+    """
+    def __init__(self, expr: str):
+        self.tokens = tokenize(expr)
+        self.pos = 0
+
+    def parse(self) -> ast.Expression:
+        if len(self.tokens) == 1:
+            raise SyntaxError("Empty expression.")
+        body = self.expr(0)
+        if self.tokens[self.pos][0] != "end":
+            self.unexpected()
+        return ast.Expression(body=body)
+
+    def unexpected(self) -> NoReturn:
+        kind, text, pos = self.tokens[self.pos]
+        if kind == "end":
+            raise SyntaxError("Unexpected end of expression.")
+        raise SyntaxError(f"Unexpected '{text}' at position {pos}.")
+
+    def expect(self, value: str):
+        if self.tokens[self.pos][1] != value:
+            self.unexpected()
+        self.pos += 1
+
+    def expr(self, rbp: int) -> ast.expr:
+        tokens = self.tokens
+        left = self.prefix()
+        while True:
+            kind, value, _ = tokens[self.pos]
+            if value == "!" or value == "!!":
+                self.pos += 1
+                left = _call("factorial" if value == "!" else "factorial2", [left])
+            elif kind == "op" and value in _INFIX:
+                lbp, op = _INFIX[value]
+                if lbp <= rbp:
+                    return left
+                self.pos += 1
+                right = self.expr(lbp - 1 if lbp == _POW_BP else lbp)
+                left = ast.BinOp(left=left, op=op(), right=right)
+            elif kind == "name" or value == "(":
+                # Implicit multiplication: 2pi, 2(3+4), (1+2)(3+4)
+                if _MUL_BP <= rbp:
+                    return left
+                right = self.expr(_MUL_BP)
+                left = ast.BinOp(left=left, op=ast.Mult(), right=right)
+            else:
+                return left
+
+    def prefix(self) -> ast.expr:
+        kind, value, _ = self.tokens[self.pos]
+        self.pos += 1
+        if kind == "num":
+            value = value.replace("_", "")
+            if value[-1] in "jJ":
+                return ast.Constant(value=complex(value))
+            return ast.Constant(value=int(value) if value.isdigit() else Literal(value))
+        if kind == "name":
+            if self.tokens[self.pos][1] == "(":
+                self.pos += 1
+                return _call(_FOLDED_FUNCS.get(value.lower(), value), self.arguments())
+            return ast.Name(id=_FOLDED_NAMES.get(value.lower(), value), ctx=ast.Load())
+        if value == "(":
+            inner = self.expr(0)
+            self.expect(")")
+            return inner
+        if value == "-" or value == "+":
+            op = ast.USub() if value == "-" else ast.UAdd()
+            return ast.UnaryOp(op=op, operand=self.expr(_UNARY_BP))
+        self.pos -= 1
+        self.unexpected()
+
+    def arguments(self) -> list:
+        args: list = []
+        if self.tokens[self.pos][1] == ")":
+            self.pos += 1
+            return args
+        while True:
+            args.append(self.expr(0))
+            if self.tokens[self.pos][1] != ",":
+                self.expect(")")
+                return args
+            self.pos += 1
+
+def _call(fname: str, args: list) -> ast.Call:
+    return ast.Call(func=ast.Name(id=fname, ctx=ast.Load()), args=args, keywords=[])
+
+# ---------------- TRIG MODE WRAPPERS ---------------- #
+
+class TrigMode:
+    def __init__(self, mode: str = "rad"):
+        self.mode = mode  # 'rad' or 'deg'
+    def set_mode(self, mode: str):
+        m = mode.lower()
+        if m not in ("rad", "deg"):
+            raise ValueError("Mode must be 'rad' or 'deg'.")
+        self.mode = m
+
+    def wrap_trig(self, f: Callable[[float], float]) -> Callable[[float], float]:
+        if self.mode == "rad":
+            return f
+        def g(x: float) -> float:
+            return f(math.radians(x))
+        return g
+
+    def wrap_atrig(self, f: Callable[[float], float]) -> Callable[[float], float]:
+        if self.mode == "rad":
+            return f
+        def g(x: float) -> float:
+            return math.degrees(f(x))
+        return g
+
+# ---------------- VECTORIZED EVALUATION ---------------- #
+
+_vector_tables: Dict[tuple, Dict[str, Callable[..., Any]]] = {}
+_float_tables: Dict[str, Any] = {}
+
+def _float_table(f: Callable[[int], int]):
+    # f(0), f(1), ... as floats, up to the last value a float can hold
+    table = _float_tables.get(f.__name__)
+    if table is None:
+        values: list = []
+        try:
+            while True:
+                values.append(float(f(len(values))))
+        except OverflowError:
+            pass
+        table = _float_tables[f.__name__] = np.array(values, dtype=float)
+    return table
+
+def _vector_table_lookup(f: Callable[[int], int], x, fallback: Callable[[Any], Any] | None = None):
+    # Table values at non-negative integers; other elements go to fallback,
+    # or are nan without one, so one bad element does not fail the array
+    table = _float_table(f)
+    x = np.asarray(x, dtype=float)
+    n = np.rint(x)
+    integral = (np.abs(x - n) <= 1e-12) & (n >= 0)
+    # Past the end of the table the result overflows a float, same as the scalar path
+    last = len(table) - 1
+    index = np.where(integral, np.minimum(n, last), 0).astype(np.intp)
+    result = np.where(integral, np.where(n <= last, table[index], np.inf), np.nan)
+    if fallback is not None and not integral.all():
+        # Only the elements off the table go through the (slower) fallback
+        result[~integral] = fallback(x[~integral])
+    return result
+
+def _vector_factorial(x):
+    # gamma(x+1) off the integers; negative integers are poles and give nan
+    return _vector_table_lookup(math.factorial, x, lambda x: _vector_scalar(math.gamma)(x + 1))
+
+def _vector_factorial2(x):
+    return _vector_table_lookup(double_factorial, x)
+
+def _vector_scalar(f: Callable[[float], float]):
+    # Elementwise f for functions numpy lacks; domain errors give nan, overflow inf
+    def safe(x: float) -> float:
+        try:
+            return f(x)
+        except ValueError:
+            return math.nan
+        except OverflowError:
+            return math.inf
+    return np.vectorize(safe, otypes=[float])
+
+def _vector_log(x, base=None):
+    return np.log(x) if base is None else np.log(x) / np.log(base)
+
+def build_vector_funcs(mode: str, numbers: str = "float") -> Dict[str, Callable[..., Any]]:
+    # ufunc equivalents of the build_env function table, one per trig mode
+    # and number mode ("float" or "complex")
+    funcs = _vector_tables.get((mode, numbers))
+    if funcs is not None:
+        return funcs
+    if np is None:
+        raise RuntimeError("Vectorized evaluation requires numpy.")
+    if mode == "deg" and numbers == "complex":
+        # np.radians and np.degrees take real arrays only
+        trig = lambda f: lambda x: f(x * (np.pi / 180))
+        atrig = lambda f: lambda x: f(x) * (180 / np.pi)
+    elif mode == "deg":
+        trig = lambda f: lambda x: f(np.radians(x))
+        atrig = lambda f: lambda x: np.degrees(f(x))
+    else:
+        trig = atrig = lambda f: f
+    funcs = {
+        "abs": np.abs, "round": lambda x, n=0: np.round(x, int(n)),
+        "floor": np.floor, "ceil": np.ceil,
+        "sqrt": np.sqrt, "exp": np.exp,
+        "log": _vector_log, "log10": np.log10,
+        "sin": trig(np.sin), "cos": trig(np.cos), "tan": trig(np.tan),
+        "asin": atrig(np.arcsin), "acos": atrig(np.arccos), "atan": atrig(np.arctan),
+        "factorial": _vector_factorial, "factorial2": _vector_factorial2,
+        "gamma": _vector_scalar(math.gamma), "lgamma": _vector_scalar(math.lgamma),
+    }
+    _vector_tables[(mode, numbers)] = funcs
+    return funcs
+
+def vector_eval(expr: str, columns: Dict[str, Any], trig: TrigMode | None = None,
+                ans: float = 0.0, mem: float = 0.0, numbers: str = "float"):
+    """
+    Evaluate expr once over whole arrays bound by name (e.g. ans, mem or data
+    columns). Domain errors give nan/inf per element instead of raising.
+    With numbers="complex" the arrays are complex128 and imaginary literals
+    are accepted, so sqrt(-1) gives 1j instead of nan.
+    """
+    if numbers not in ("float", "complex"):
+        raise ValueError("Vectorized evaluation supports number modes float and complex.")
+    mode = NUMBER_MODES[numbers]
+    dtype = np.complex128 if mode.imaginary else float
+    funcs = build_vector_funcs(trig.mode if trig else "rad", mode.name)
+    names: Dict[str, Any] = {**CONSTANTS, "ans": ans, "mem": mem}
+    for k, v in columns.items():
+        names[k] = np.asarray(v, dtype=dtype)
+    constants = {k: v for k, v in CONSTANTS.items() if k not in columns}
+    shape = np.broadcast_shapes(*(np.shape(v) for v in names.values()))
+    with np.errstate(all="ignore"):
+        result = compile_expr(expr_cache.get(expr), funcs, constants, numbers=mode)(names)
+    return np.broadcast_to(np.asarray(result, dtype=dtype), shape)
+
+# ---------------- FACTORIALS ---------------- #
+
+def _integer_arg(x: float, fname: str) -> int:
+    # Allow non-negative integers or floats very close to ints
+    n = int(round(x))
+    if abs(x - n) > 1e-12 or n < 0:
+        raise ValueError(f"{fname}() only defined for non-negative integers.")
+    return n
+
+def _factorial_arg(x: Any) -> int | None:
+    # n for (nearly) integral x; None for other reals, which go through gamma
+    n = int(round(x))
+    if abs(x - n) > 1e-12:
+        return None
+    if n < 0:
+        raise ValueError("factorial() not defined for negative integers.")
+    return n
+
+def _factorial_bits(n: int) -> float:
+    return n * max(math.log2(n) - 1.4427, 1.0) if n > 1 else 1.0
+
+# Largest arguments whose results still fit in a float
+_FLOAT_FACTORIAL_MAX = 170
+_FLOAT_FACTORIAL2_MAX = 300
+
+# 0! .. 170! exactly and as floats, so small factorials are a lookup
+_EXACT_FACTORIALS = tuple(itertools.accumulate(range(1, _FLOAT_FACTORIAL_MAX + 1),
+                                               operator.mul, initial=1))
+_FLOAT_FACTORIALS = tuple(map(float, _EXACT_FACTORIALS))
+
+def range_product(lo: int, hi: int) -> int:
+    # lo * (lo+1) * ... * hi, split in halves so the big multiplications
+    # are between operands of similar size
+    if hi - lo < 16:
+        return math.prod(range(lo, hi + 1))
+    mid = (lo + hi) // 2
+    return range_product(lo, mid) * range_product(mid + 1, hi)
+
+def _factorial_from(m: int, m_factorial: int, n: int) -> int:
+    # n! from a known m!
+    if n >= m:
+        return m_factorial * range_product(m + 1, n)
+    return m_factorial // range_product(n + 1, m)
+
+class FactorialCache:
+    """
+    Recently computed exact factorials, kept as checkpoints up to a total
+    size in bits. n! near a checkpoint m! is finished with the product over
+    the gap instead of being rebuilt from 1.
+    """
+    def __init__(self, max_bits: int = 1 << 28):
+        self.max_bits = max_bits
+        self._data: OrderedDict[int, int] = OrderedDict()
+        self._bits = 0
+
+    def get(self, n: int) -> int:
+        bits = _factorial_bits(n)
+        m = min(self._data, key=lambda m: abs(m - n), default=None)
+        if m == n:
+            # Cached values still count against the active size cap
+            limits = active_limits.get()
+            if limits is not None:
+                limits.check_int_bits(bits)
+            self._data.move_to_end(n)
+            return self._data[n]
+        if m is not None and abs(m - n) * 8 < n:
+            value = run_limited(_factorial_from, m, self._data[m], n, bits=bits)
+        else:
+            value = run_limited(math.factorial, n, bits=bits)
+        self.store(n, value)
+        return value
+
+    def store(self, n: int, value: int):
+        size = value.bit_length()
+        if size > self.max_bits:
+            return
+        self._data[n] = value
+        self._bits += size
+        while self._bits > self.max_bits:
+            _, old = self._data.popitem(last=False)
+            self._bits -= old.bit_length()
+
+    def clear(self):
+        self._data.clear()
+        self._bits = 0
+
+factorials = FactorialCache()
+
+def factorial_safe(x: float) -> float:
+    n = _factorial_arg(x)
+    if n is None:
+        return math.gamma(x + 1)
+    if n > _FLOAT_FACTORIAL_MAX:
+        raise OverflowError("factorial() result too large.")
+    return _FLOAT_FACTORIALS[n]
+
+def double_factorial(n: int) -> int:
+    return math.prod(range(n, 0, -2))
+
+def factorial2_safe(x: float) -> float:
+    n = _integer_arg(x, "factorial2")
+    if n > _FLOAT_FACTORIAL2_MAX:
+        raise OverflowError("factorial2() result too large.")
+    return float(run_limited(double_factorial, n, bits=_factorial_bits(n) / 2))
+
+def factorial_exact(x: Any) -> Any:
+    n = _factorial_arg(x)
+    if n is None:
+        return math.gamma(x + 1)
+    if n <= _FLOAT_FACTORIAL_MAX:
+        return _EXACT_FACTORIALS[n]
+    return factorials.get(n)
+
+def factorial2_exact(x: Any) -> int:
+    n = _integer_arg(x, "factorial2")
+    return run_limited(double_factorial, n, bits=_factorial_bits(n) / 2)
+
+# Gaps up to this many bits of product are multiplied out exactly
+_RATIO_EXACT_BITS = 2.0 ** 16
+
+def _ratio_bits(m: int, n: int) -> float:
+    return abs(m - n) * math.log2(max(m, n, 2))
+
+def factorial_ratio_safe(a: float, b: float) -> float:
+    """
+    a!/b! as a float without building either factorial. Integer arguments
+    multiply out the gap exactly and round once; anything else, or a gap
+    too large for that, is computed in log space from lgamma.
+    """
+    m, n = _factorial_arg(a), _factorial_arg(b)
+    if m is not None and n is not None:
+        if max(m, n) <= _FLOAT_FACTORIAL_MAX:
+            return _FLOAT_FACTORIALS[m] / _FLOAT_FACTORIALS[n]
+        if _ratio_bits(m, n) <= _RATIO_EXACT_BITS:
+            if m >= n:
+                return float(range_product(n + 1, m))
+            return 1 / range_product(m + 1, n)
+        if m > n:
+            raise OverflowError("factorial() result too large.")
+        return 0.0
+    return math.exp(math.lgamma(a + 1) - math.lgamma(b + 1))
+
+def factorial_ratio_exact(a: Any, b: Any) -> Any:
+    # a!/b! as an exact int (or exact quotient) from the product over the gap
+    m, n = _factorial_arg(a), _factorial_arg(b)
+    if m is None or n is None:
+        return factorial_ratio_safe(a, b)
+    if m >= n:
+        return run_limited(range_product, n + 1, m, bits=_ratio_bits(m, n))
+    return int_truediv(1, run_limited(range_product, m + 1, n, bits=_ratio_bits(m, n)))
+
+# factorial implementation -> matching a!/b! shortcut used by the Compiler
+FACTORIAL_RATIOS: Dict[Callable[..., Any], Callable[[Any, Any], Any]] = {
+    factorial_safe: factorial_ratio_safe,
+    factorial_exact: factorial_ratio_exact,
+}
+
+def factorial_ratio_args(node: ast.AST) -> tuple | None:
+    # (a, b) for a node of the form factorial(a) / factorial(b)
+    if not (isinstance(node, ast.BinOp) and isinstance(node.op, ast.Div)):
+        return None
+    calls = [c for c in (node.left, node.right)
+             if isinstance(c, ast.Call) and isinstance(c.func, ast.Name) and c.func.id == "factorial"
+             and len(c.args) == 1 and not c.keywords]
+    if len(calls) == 2:
+        return calls[0].args[0], calls[1].args[0]
+    return None
+
+# ---------------- BIG INTEGER DISPLAY ---------------- #
+
+# Integers up to this many digits are printed in full
+_FULL_DIGITS = 100
+
+_LOG_CONTEXT = decimal.Context(prec=60)
+_LOG10_2 = _LOG_CONTEXT.log10(decimal.Decimal(2))
+_LOG_EDGE = decimal.Decimal("1e-40")  # well above the error of the 60-digit log
+# Leading digits the 60-digit log settles exactly, even for 10**9-digit n
+_LEAD_DIGITS = 40
+
+def int_digits(n: int, lead: int) -> tuple:
+    """
+    (number of decimal digits of n, its first `lead` digits), from the top
+    192 bits and a 60-digit log10 instead of a full decimal conversion.
+    lead is capped at _LEAD_DIGITS, which is all the log can resolve.
+    """
+    lead = min(lead, _LEAD_DIGITS)
+    n = abs(n)
+    if n < 10 ** (lead + 1):
+        text = str(n)
+        return len(text), text[:lead]
+    shift = max(0, n.bit_length() - 192)
+    ctx = _LOG_CONTEXT
+    log = ctx.add(ctx.log10(decimal.Decimal(n >> shift)), ctx.multiply(shift, _LOG10_2))
+    exponent = int(log)  # digits - 1
+    frac = ctx.subtract(log, exponent)
+    if min(frac, ctx.subtract(1, frac)) < _LOG_EDGE:
+        # Within rounding of a power of ten: settle the digit count exactly
+        exponent = round(log)
+        if n < 10 ** exponent:
+            exponent -= 1
+        frac = max(ctx.subtract(log, exponent), decimal.Decimal(0))
+    mantissa = ctx.power(10, ctx.add(frac, lead - 1))
+    head = min(int(mantissa), 10 ** lead - 1)
+    if head + 1 < 10 ** lead and ctx.subtract(head + 1, mantissa) < ctx.multiply(mantissa, _LOG_EDGE):
+        # Within rounding of the next lead digits (15 * 10**399 reads as
+        # 1499...): settle them exactly
+        if n >= (head + 1) * 10 ** (exponent + 1 - lead):
+            head += 1
+    return exponent + 1, str(head)
+
+def format_int(n: int, precision: int) -> str:
+    # Long integers show leading and trailing digits and a digit count
+    if n.bit_length() <= _FULL_DIGITS * 3:
+        return str(n)
+    digits, head = int_digits(n, precision)
+    if digits <= max(_FULL_DIGITS, 2 * precision):
+        return str(int_to_decimal(n))
+    shown = len(head)
+    tail = str(abs(n) % 10 ** shown).zfill(shown)
+    return f"{'-' if n < 0 else ''}{head}...{tail} ({digits} digits)"
+
+def int_to_decimal(n: int) -> decimal.Decimal:
+    """
+    Exact Decimal for n, split on binary halves: hi * 2**w + lo. libmpdec
+    multiplies big numbers in subquadratic time, so this is much faster
+    than str(n) for huge n and is not subject to the int string limit.
+    """
+    ctx = decimal.Context(prec=decimal.MAX_PREC, Emax=decimal.MAX_EMAX, Emin=decimal.MIN_EMIN)
+    ctx.traps[decimal.Inexact] = True
+    powers: Dict[int, decimal.Decimal] = {}
+
+    def pow2(w: int) -> decimal.Decimal:
+        if w not in powers:
+            powers[w] = ctx.power(decimal.Decimal(2), w)
+        return powers[w]
+
+    def inner(m: int, w: int) -> decimal.Decimal:
+        if w <= 4096:
+            return decimal.Decimal(m)
+        half = w >> 1
+        hi = m >> half
+        lo = m - (hi << half)
+        return ctx.add(ctx.multiply(inner(hi, w - half), pow2(half)), inner(lo, half))
+
+    d = inner(abs(n), n.bit_length())
+    return d.copy_negate() if n < 0 else d
+
+def write_int(n: int, out, chunk: int = 1 << 16):
+    # All digits of n, written in pieces rather than as one huge write
+    text = str(int_to_decimal(n))
+    for i in range(0, len(text), chunk):
+        out.write(text[i:i + chunk])
+    out.write("\n")
+
+# ---------------- EXACT RATIONALS ---------------- #
+
+# Denominators below this size are never worth a gcd
+_RATIONAL_MIN_BITS = 64
+
+class Rational:
+    """
+    Exact fraction num/den (den > 0) for "exact" mode. Unlike Fraction it
+    does not reduce after every operation: the gcd is taken only once the
+    denominator has doubled in size since the last reduction, so a long sum
+    pays for a handful of gcds instead of one per term. Values are fully
+    reduced before they are stored or shown. Mixing with a float gives a
+    float, so math functions work on the float value.
+    """
+    __slots__ = ("num", "den", "limit")
+
+    def __init__(self, num: int, den: int = 1, limit: int = _RATIONAL_MIN_BITS):
+        # Callers guarantee den > 0; limit is the denominator size that
+        # triggers the next reduction
+        self.num = num
+        self.den = den
+        self.limit = limit
+
+    @classmethod
+    def of(cls, num: int, den: int) -> Rational:
+        if not den:
+            raise ZeroDivisionError("division by zero")
+        if den < 0:
+            num, den = -num, -den
+        return _rational(num, den, 0)
+
+    def reduce(self) -> Any:
+        # Lowest terms; an int when the denominator is 1
+        g = math.gcd(self.num, self.den)
+        num, den = self.num // g, self.den // g
+        if den == 1:
+            return num
+        return Rational(num, den, max(2 * den.bit_length(), _RATIONAL_MIN_BITS))
+
+    def __add__(self, other):
+        if isinstance(other, float):
+            return float(self) + other
+        o = _rational_parts(other)
+        if o is None:
+            return NotImplemented
+        num, den, limit = o
+        if den == self.den:
+            return _rational(self.num + num, den, max(limit, self.limit))
+        return _rational(self.num * den + num * self.den, self.den * den, max(limit, self.limit))
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        return self + -other
+
+    def __rsub__(self, other):
+        return -self + other
+
+    def __mul__(self, other):
+        if isinstance(other, float):
+            return float(self) * other
+        o = _rational_parts(other)
+        if o is None:
+            return NotImplemented
+        num, den, limit = o
+        return _rational(self.num * num, self.den * den, max(limit, self.limit))
+
+    __rmul__ = __mul__
+
+    def __truediv__(self, other):
+        if isinstance(other, float):
+            return float(self) / other
+        o = _rational_parts(other)
+        if o is None:
+            return NotImplemented
+        num, den, limit = o
+        if not num:
+            raise ZeroDivisionError("division by zero")
+        if num < 0:
+            num, den = -num, -den
+        return _rational(self.num * den, self.den * num, max(limit, self.limit))
+
+    def __rtruediv__(self, other):
+        if isinstance(other, float):
+            return other / float(self)
+        o = _rational_parts(other)
+        if o is None:
+            return NotImplemented
+        return Rational(*o[:2]) / self
+
+    def __floordiv__(self, other):
+        if isinstance(other, float):
+            return float(self) // other
+        q = self / other
+        return q if q is NotImplemented else q.num // q.den
+
+    def __rfloordiv__(self, other):
+        if isinstance(other, float):
+            return other // float(self)
+        q = self.__rtruediv__(other)
+        return q if q is NotImplemented else q.num // q.den
+
+    def __mod__(self, other):
+        if isinstance(other, float):
+            return float(self) % other
+        q = self // other
+        return q if q is NotImplemented else self - other * q
+
+    def __rmod__(self, other):
+        if isinstance(other, float):
+            return other % float(self)
+        q = self.__rfloordiv__(other)
+        return q if q is NotImplemented else other - self * q
+
+    def __pow__(self, other):
+        return rational_power(self, other)
+
+    def __rpow__(self, other):
+        return rational_power(other, self)
+
+    def __neg__(self):
+        return Rational(-self.num, self.den, self.limit)
+
+    def __pos__(self):
+        return self
+
+    def __abs__(self):
+        return Rational(abs(self.num), self.den, self.limit)
+
+    def __bool__(self):
+        return self.num != 0
+
+    def __float__(self):
+        return self.num / self.den
+
+    def __int__(self):
+        return self.__trunc__()
+
+    def __trunc__(self):
+        return self.num // self.den if self.num >= 0 else -(-self.num // self.den)
+
+    def __floor__(self):
+        return self.num // self.den
+
+    def __ceil__(self):
+        return -(-self.num // self.den)
+
+    def __round__(self, ndigits=None):
+        r = round(fractions.Fraction(self.num, self.den), ndigits)
+        return r if ndigits is None else exact_literal(r)
+
+    def _compare(self, other, op):
+        if isinstance(other, float):
+            return op(float(self), other)
+        o = _rational_parts(other)
+        if o is None:
+            return NotImplemented
+        return op(self.num * o[1], o[0] * self.den)
+
+    def __eq__(self, other):
+        return self._compare(other, operator.eq)
+
+    def __lt__(self, other):
+        return self._compare(other, operator.lt)
+
+    def __le__(self, other):
+        return self._compare(other, operator.le)
+
+    def __gt__(self, other):
+        return self._compare(other, operator.gt)
+
+    def __ge__(self, other):
+        return self._compare(other, operator.ge)
+
+    def __hash__(self):
+        return hash(fractions.Fraction(self.num, self.den))
+
+    def __reduce__(self):
+        return Rational, (self.num, self.den, self.limit)
+
+    def __repr__(self):
+        r = self.reduce()
+        return str(r) if type(r) is int else f"{r.num}/{r.den}"
+
+def _rational(num: int, den: int, limit: int) -> Rational:
+    # New value, reduced only once den has outgrown the last reduced size
+    if den.bit_length() > limit:
+        g = math.gcd(num, den)
+        if g != 1:
+            num //= g
+            den //= g
+        limit = max(2 * den.bit_length(), _RATIONAL_MIN_BITS)
+    return Rational(num, den, limit)
+
+def _rational_parts(x: Any) -> tuple | None:
+    if type(x) is int:
+        return x, 1, _RATIONAL_MIN_BITS
+    if type(x) is Rational:
+        return x.num, x.den, x.limit
+    return None
+
+def exact_literal(value: Any) -> Any:
+    # 0.1 reads as 1/10: floats are taken at their shortest decimal form,
+    # and literals at their text even past the float range
+    if isinstance(value, Literal) or isinstance(value, float) and math.isfinite(value):
+        value = fractions.Fraction(repr(value))
+    if isinstance(value, fractions.Fraction):
+        return value.numerator if value.denominator == 1 else \
+            Rational(value.numerator, value.denominator)
+    return value
+
+def exact_store(value: Any) -> Any:
+    # Results are kept in lowest terms; floats from math functions stay floats
+    return value.reduce() if type(value) is Rational else value
+
+def rational_truediv(a: Any, b: Any) -> Any:
+    if type(a) is int and type(b) is int:
+        if b and not a % b:
+            return a // b
+        return Rational.of(a, b)
+    return a / b
+
+def rational_factorial(x: Any) -> Any:
+    # factorial_exact under its own identity, so a!/b! gets an exact quotient
+    return factorial_exact(x)
+
+def rational_factorial_ratio(a: Any, b: Any) -> Any:
+    m, n = _factorial_arg(a), _factorial_arg(b)
+    if m is not None and n is not None and m < n:
+        return rational_truediv(1, factorial_ratio_exact(b, a))
+    return factorial_ratio_exact(a, b)
+
+FACTORIAL_RATIOS[rational_factorial] = rational_factorial_ratio
+
+def rational_power(base: Any, exp: Any) -> Any:
+    # Integer exponents stay exact (2^-3 is 1/8); anything else is a float power
+    if type(exp) is Rational:
+        exp = exp.reduce()
+    if type(exp) is not int:
+        return float(base) ** exp if type(base) is Rational else base ** float(exp)
+    if type(base) is int:
+        if exp >= 0:
+            return power(base, exp)
+        return Rational.of(1, power(base, -exp))
+    if type(base) is not Rational:
+        return power(base, exp)
+    base = base.reduce()
+    if type(base) is int:
+        return rational_power(base, exp)
+    num, den = (base.num, base.den) if exp >= 0 else (base.den, base.num)
+    if num < 0:
+        num, den = -num, -den
+    return Rational(power(num, abs(exp)), power(den, abs(exp)))
+
+def sqrt_rational(x: Any) -> Any:
+    # Exact root when numerator and denominator are both perfect squares
+    if type(x) is Rational:
+        x = x.reduce()
+        if type(x) is Rational and x.num >= 0:
+            n, d = math.isqrt(x.num), math.isqrt(x.den)
+            if n * n == x.num and d * d == x.den:
+                return Rational(n, d)
+            return math.sqrt(x.num / x.den)
+    return sqrt_exact(x)
+
+def format_rational(q: Rational, precision: int) -> str:
+    q = q.reduce()
+    if type(q) is int:
+        return format_int(q, precision)
+    return f"{format_int(q.num, precision)}/{format_int(q.den, precision)}"
+
+EXACT_BINOPS: Dict[type, Callable[[Any, Any], Any]] = {
+    **INT_BINOPS, ast.Div: rational_truediv, ast.Pow: rational_power,
+}
+
+# ---------------- ARBITRARY PRECISION ---------------- #
+
+# Fixed-point helpers: a real v at `bits` bits is the integer floor(v * 2**bits)
+
+_GUARD_BITS = 32
+# Below this many digits the decimal module's own exp and ln are faster
+MP_NATIVE_DIGITS = 250
+
+def _working_bits() -> int:
+    # Bits for the current decimal context's digits, plus guard bits
+    return int(decimal.getcontext().prec * 3.3219280948873626) + _GUARD_BITS
+
+def _check_time():
+    # A series runs inside one compiled node, so it watches the deadline itself
+    limits = active_limits.get()
+    if limits is not None:
+        limits.check_time()
+
+# Below this many quotient bits CPython's own // is as fast
+_NEWTON_BITS = 1 << 14
+
+def _reciprocal(x: int, p: int) -> int:
+    # About 2**(2p) / x for an x of p bits. Newton steps double the correct
+    # bits, each at the precision it needs, so the cost is a few big
+    # multiplications instead of one quadratic division
+    if p <= _NEWTON_BITS:
+        return (1 << (2 * p)) // x
+    h = p // 2 + 1
+    r = _reciprocal(x >> (p - h), h) << (p - h)
+    return r + ((r * ((1 << (2 * p)) - x * r)) >> (2 * p))
+
+def _long_divide(a: int, b: int) -> int:
+    """
+    floor(a / b) for b > 0. CPython's // is quadratic in the size
+    of b, which dominates a series at 100000 digits; a long quotient is
+    instead a truncated product with the divisor's reciprocal, then
+    corrected exactly with one short division.
+    """
+    n = b.bit_length()
+    p = a.bit_length() - n + 32  # quotient bits, plus guard bits
+    if p <= _NEWTON_BITS or n <= _NEWTON_BITS:
+        return a // b
+    shift = n - p  # both operands cut (or padded) to p bits of divisor
+    bt = b >> shift if shift >= 0 else b << -shift
+    at = a >> shift if shift >= 0 else a << -shift
+    q = (at * _reciprocal(bt, p)) >> (2 * p)
+    return q + (a - q * b) // b
+
+def _split(n1: int, n2: int, a, b, p, q) -> tuple:
+    """
+    Binary splitting of sum a(k)/b(k) * p(0)...p(k) / (q(0)...q(k)) for
+    n1 <= k < n2, as (P, Q, B, T); the sum is T / (B * Q). Big products
+    are always between halves of similar size.
+    """
+    if n2 - n1 == 1:
+        pk = p(n1)
+        return pk, q(n1), b(n1), a(n1) * pk
+    _check_time()
+    m = (n1 + n2) // 2
+    P1, Q1, B1, T1 = _split(n1, m, a, b, p, q)
+    P2, Q2, B2, T2 = _split(m, n2, a, b, p, q)
+    return P1 * P2, Q1 * Q2, B1 * B2, B2 * Q2 * T1 + B1 * P1 * T2
+
+def _one(k: int) -> int:
+    return 1
+
+def _series(terms: int, bits: int, p, q, a=_one, b=_one) -> int:
+    P, Q, B, T = _split(0, terms, a, b, p, q)
+    return _long_divide(T << bits, B * Q)
+
+def _terms(log2_ratio: Callable[[int], float], bits: int) -> int:
+    # Number of terms until the running log2 of the term drops below -bits
+    total, k = 0.0, 1
+    while total > -bits - 8:
+        total += log2_ratio(k)
+        k += 1
+    return k
+
+def _chudnovsky_pi(bits: int) -> int:
+    c3 = 10939058860032000  # 640320**3 / 24
+
+    def bs(a: int, b: int) -> tuple:
+        if b - a == 1:
+            if a == 0:
+                pab = qab = 1
+            else:
+                pab = (6 * a - 5) * (2 * a - 1) * (6 * a - 1)
+                qab = a * a * a * c3
+            tab = pab * (13591409 + 545140134 * a)
+            return pab, qab, -tab if a & 1 else tab
+        _check_time()
+        m = (a + b) // 2
+        p1, q1, t1 = bs(a, m)
+        p2, q2, t2 = bs(m, b)
+        return p1 * p2, q1 * q2, q2 * t1 + p1 * t2
+
+    _, q, t = bs(0, bits // 47 + 2)  # about 47 bits per term
+    return _long_divide(q * 426880 * math.isqrt(10005 << (2 * bits)), t)
+
+def _atanh_inv(m: int, bits: int) -> int:
+    # atanh(1/m) = sum 1 / ((2k+1) m^(2k+1))
+    terms = int(bits / (2 * math.log2(m))) + 2
+    m2 = m * m
+    return _series(terms, bits, _one, lambda k: m if k == 0 else m2, b=lambda k: 2 * k + 1)
+
+def _ln2(bits: int) -> int:
+    b = bits + 8
+    return (18 * _atanh_inv(26, b) - 2 * _atanh_inv(4801, b) + 8 * _atanh_inv(8749, b)) >> 8
+
+def _e(bits: int) -> int:
+    terms = _terms(lambda k: -math.log2(k), bits)
+    return _series(terms, bits, _one, lambda k: k or 1)
+
+_fixed_constants: Dict[str, tuple] = {}
+_CONSTANT_FUNCS = {"pi": _chudnovsky_pi, "ln2": _ln2, "e": _e}
+
+def fixed_constant(name: str, bits: int) -> int:
+    # Cached at the most bits asked for so far; lower precisions are a shift
+    cached = _fixed_constants.get(name)
+    if cached is None or cached[0] < bits:
+        cached = _fixed_constants[name] = (bits, _CONSTANT_FUNCS[name](bits))
+    return cached[1] >> (cached[0] - bits)
+
+def to_fixed(x: decimal.Decimal, bits: int) -> int:
+    # x is finite, so the exponent is an int ("n", "N", "F" mark nan and inf)
+    sign, digits, exp = x.as_tuple()
+    exp = int(exp)
+    c = int(decimal.Decimal((0, digits, 0)))
+    v = (c * 10 ** exp) << bits if exp >= 0 else _long_divide(c << bits, 10 ** -exp)
+    return -v if sign else v
+
+def from_fixed(v: int, bits: int) -> decimal.Decimal:
+    # v / 2**bits == v * 5**bits / 10**bits, converted exactly then rounded
+    return int_to_decimal(v * 5 ** bits).scaleb(-bits, decimal.getcontext())
+
+def _exp_rational(p: int, s: int, bits: int) -> int:
+    # exp(p / 2**s) for a small p / 2**s
+    r = math.log2(p) - s
+    terms = _terms(lambda k: r - math.log2(k), bits)
+    return _series(terms, bits, lambda k: p if k else 1, lambda k: k << s if k else 1)
+
+def _cos_sin_rational(p: int, s: int, bits: int) -> tuple:
+    r = 2 * (math.log2(p) - s)
+    p2, s2 = -p * p, 2 * s
+    terms = _terms(lambda k: r - math.log2(2 * k * (2 * k + 1)), bits)
+    cos = _series(terms, bits, lambda k: p2 if k else 1,
+                  lambda k: ((2 * k - 1) * 2 * k) << s2 if k else 1)
+    sin = _series(terms, bits, lambda k: p2 if k else p,
+                  lambda k: (2 * k * (2 * k + 1)) << s2 if k else 1 << s)
+    return cos, sin
+
+def _atan_rational(p: int, s: int, bits: int) -> int:
+    r = 2 * (math.log2(p) - s)
+    p2, s2 = -p * p, 2 * s
+    terms = _terms(lambda k: r, bits)
+    return _series(terms, bits, lambda k: p2 if k else p,
+                   lambda k: 1 << s2 if k else 1 << s, b=lambda k: 2 * k + 1)
+
+def _chunks(x: int, bits: int):
+    # Bit-burst: (p, s) with x/2**bits = sum of p / 2**s, taking 8 bits and
+    # then twice as many each time, so every series has a short argument
+    lo, hi = 0, 8
+    while lo < bits:
+        hi = min(hi, bits)
+        p = (x >> (bits - hi)) & ((1 << (hi - lo)) - 1)
+        if p:
+            yield p, hi
+        lo, hi = hi, 2 * hi
+
+def _exp_fixed(x: int, bits: int) -> int:
+    # exp(x) for 0 <= x < 1
+    result = 1 << bits
+    for p, s in _chunks(x, bits):
+        result = (result * _exp_rational(p, s, bits)) >> bits
+    return result
+
+def _cos_sin_fixed(x: int, bits: int) -> tuple:
+    # (cos x, sin x) for 0 <= x < 1, combined chunk by chunk with the
+    # angle-addition formulas
+    c, s = 1 << bits, 0
+    for p, sh in _chunks(x, bits):
+        cp, sp = _cos_sin_rational(p, sh, bits)
+        c, s = (c * cp - s * sp) >> bits, (s * cp + c * sp) >> bits
+    return c, s
+
+def _atan_fixed(x: int, bits: int) -> int:
+    # atan(x) for 0 <= x <= 1. Three halvings, atan(x) = 2 atan(x / (1 +
+    # sqrt(1 + x^2))), bring x under 1/10; then each step takes the
+    # leading chunk r and continues with (x - r) / (1 + x r)
+    one = 1 << bits
+    for _ in range(3):
+        x = _long_divide(x << bits, one + math.isqrt(one * one + x * x))
+    total, lo, hi = 0, 0, 8
+    while x and lo < bits:
+        hi = min(hi, bits)
+        p = x >> (bits - hi)
+        if p:
+            r = p << (bits - hi)
+            total += _atan_rational(p, hi, bits)
+            x = _long_divide((x - r) << bits, one + ((x * r) >> bits))
+        lo, hi = hi, 2 * hi
+    return (total << 3) + (x << 3)
+
+def mp_exp(x: decimal.Decimal) -> decimal.Decimal:
+    ctx = decimal.getcontext()
+    if not x.is_finite() or abs(x) > 2_400_000 or ctx.prec < MP_NATIVE_DIGITS:
+        return x.exp()  # infinities, certain overflow or underflow
+    bits = _working_bits()
+    # x = k ln2 + r with 0 <= r < ln2, so exp(x) = 2**k exp(r)
+    extra = max(int(abs(x)).bit_length(), 1) + 8
+    ln2 = fixed_constant("ln2", bits + extra)
+    v = to_fixed(x, bits + extra)
+    k, r = divmod(v, ln2)
+    e = _exp_fixed(r >> extra, bits)
+    with decimal.localcontext(ctx) as c:
+        c.prec += 10
+        return ctx.plus(c.multiply(from_fixed(e, bits), c.power(2, k)))
+
+def mp_log(x: decimal.Decimal) -> decimal.Decimal:
+    ctx = decimal.getcontext()
+    if not x.is_finite() or x <= 0 or ctx.prec < MP_NATIVE_DIGITS:
+        return x.ln()  # ln(inf), or the domain error for x <= 0
+    # x = m * 10**a with 1 <= m < 10; log m by Halley steps on exp at
+    # rising precision, starting from the float value
+    a = x.adjusted()
+    m = x.scaleb(-a)
+    y = decimal.Decimal(repr(math.log(m)))
+    precs = []
+    p = ctx.prec + 10
+    while p > 15:
+        precs.append(p)
+        p = p // 3 + 5  # each step triples the correct digits
+    with decimal.localcontext(ctx) as c:
+        for p in reversed(precs):
+            c.prec = p
+            ey = mp_exp(y)
+            y = y + 2 * (m - ey) / (m + ey)
+        if a:
+            y = y + a * _ln10()
+    return ctx.plus(y)
+
+_ln10_cache: Dict[int, decimal.Decimal] = {}
+
+def _ln10() -> decimal.Decimal:
+    # ln 10 = 3 ln 2 + ln 1.25, once per precision
+    prec = decimal.getcontext().prec
+    value = _ln10_cache.get(prec)
+    if value is None:
+        with decimal.localcontext() as c:
+            c.prec += 5
+            bits = _working_bits()
+            value = 3 * from_fixed(fixed_constant("ln2", bits), bits) + mp_log(decimal.Decimal("1.25"))
+        value = _ln10_cache[prec] = +value
+    return value
+
+def mp_pi() -> decimal.Decimal:
+    bits = _working_bits()
+    return from_fixed(fixed_constant("pi", bits), bits)
+
+def mp_cos_sin(x: decimal.Decimal) -> tuple:
+    if not x.is_finite():
+        raise ValueError("math domain error")
+    bits = _working_bits()
+    ctx = decimal.getcontext()
+    # x = k pi/2 + r with |r| <= pi/4; the quadrant picks the signs
+    extra = max(int(abs(x)).bit_length(), 1) + 8
+    half_pi = fixed_constant("pi", bits + extra) >> 1
+    v = to_fixed(x, bits + extra)
+    k = (2 * v + half_pi) // (2 * half_pi)
+    r = (v - k * half_pi) >> extra
+    c, s = _cos_sin_fixed(abs(r), bits)
+    if r < 0:
+        s = -s
+    c, s = ((c, s), (-s, c), (-c, -s), (s, -c))[k % 4]
+    return ctx.plus(from_fixed(c, bits)), ctx.plus(from_fixed(s, bits))
+
+def mp_sin(x: decimal.Decimal) -> decimal.Decimal:
+    return mp_cos_sin(x)[1]
+
+def mp_cos(x: decimal.Decimal) -> decimal.Decimal:
+    return mp_cos_sin(x)[0]
+
+def mp_tan(x: decimal.Decimal) -> decimal.Decimal:
+    with decimal.localcontext() as c:
+        c.prec += 5
+        cos, sin = mp_cos_sin(x)
+        if not cos:
+            raise ValueError("math domain error")
+        t = sin / cos
+    return +t
+
+def mp_atan(x: decimal.Decimal) -> decimal.Decimal:
+    if x.is_nan():
+        return x
+    if x.is_infinite():
+        half_pi = mp_pi() / 2
+        return half_pi if x > 0 else -half_pi
+    bits = _working_bits()
+    ctx = decimal.getcontext()
+    # atan(x) = pi/2 - atan(1/x) above 1; odd, so only x >= 0 is computed
+    v = to_fixed(abs(x), bits)
+    one = 1 << bits
+    if v > one:
+        a = (fixed_constant("pi", bits) >> 1) - _atan_fixed(_long_divide(one << bits, v), bits)
+    else:
+        a = _atan_fixed(v, bits)
+    result = ctx.plus(from_fixed(a, bits))
+    return -result if x < 0 else result
+
+def mp_asin(x: decimal.Decimal) -> decimal.Decimal:
+    if abs(x) > 1:
+        raise ValueError("math domain error")
+    if abs(x) == 1:
+        half_pi = mp_pi() / 2
+        return half_pi if x > 0 else -half_pi
+    with decimal.localcontext() as c:
+        c.prec += 5
+        a = mp_atan(x / (1 - x * x).sqrt())
+    return +a
+
+def mp_acos(x: decimal.Decimal) -> decimal.Decimal:
+    with decimal.localcontext() as c:
+        c.prec += 5
+        a = mp_pi() / 2 - mp_asin(x)
+    return +a
+
+# ---------------- DECIMAL PRECISION ---------------- #
+
+# Extra digits carried beyond the displayed precision
+DECIMAL_GUARD_DIGITS = 5
+DECIMAL_MAX_PRECISION = 100_000
+
+_decimal_contexts: Dict[int, decimal.Context] = {}
+_decimal_constants: Dict[int, Dict[str, Any]] = {}
+
+def decimal_context(digits: int) -> decimal.Context:
+    # One context per displayed precision; arithmetic runs with guard digits
+    ctx = _decimal_contexts.get(digits)
+    if ctx is None:
+        ctx = _decimal_contexts[digits] = decimal.Context(prec=digits + DECIMAL_GUARD_DIGITS)
+    return ctx
+
+def decimal_constants(digits: int) -> Dict[str, Any]:
+    # pi, e, tau, inf and nan at the working precision, computed once per precision
+    constants = _decimal_constants.get(digits)
+    if constants is None:
+        with decimal.localcontext(decimal_context(digits)):
+            bits = _working_bits()
+            pi = from_fixed(fixed_constant("pi", bits), bits)
+            constants = _decimal_constants[digits] = {
+                "pi": pi, "e": from_fixed(fixed_constant("e", bits), bits),
+                "tau": from_fixed(fixed_constant("pi", bits) << 1, bits),
+                "inf": decimal.Decimal("Infinity"), "nan": decimal.Decimal("NaN"),
+            }
+    return constants
+
+def decimal_value(value: Any) -> Any:
+    # Literals and results as Decimals; floats are taken at their shortest
+    # decimal form, so 0.1 reads as 0.1 and not as its binary approximation
+    if isinstance(value, decimal.Decimal):
+        return value
+    if isinstance(value, float):
+        return decimal.Decimal(repr(value))
+    if type(value) is Rational:
+        return decimal.Decimal(value.num) / value.den
+    return decimal.Decimal(value)
+
+def decimal_fallback(f: Callable[..., Any]) -> Callable[..., Any]:
+    # Functions without a Decimal version run in float; the result comes back
+    # as a Decimal so it still mixes with the rest of the expression
+    def g(*args: Any) -> Any:
+        return decimal_value(f(*args))
+    return g
+
+def decimal_truediv(a: Any, b: Any) -> Any:
+    return decimal_value(a) / b
+
+def decimal_floordiv(a: Any, b: Any) -> Any:
+    # Floored like float //, where Decimal truncates toward zero
+    return _decimal_divmod(a, b)[0]
+
+def decimal_mod(a: Any, b: Any) -> Any:
+    return _decimal_divmod(a, b)[1]
+
+def _decimal_divmod(a: Any, b: Any) -> tuple:
+    q, r = divmod(decimal_value(a), decimal_value(b))
+    if r and (r < 0) != (b < 0):
+        q, r = q - 1, r + b
+    return q, r
+
+def decimal_power(base: Any, exp: Any) -> Any:
+    if type(base) is int and type(exp) is int and exp >= 0:
+        return power(base, exp)
+    return decimal_value(base) ** exp
+
+def decimal_round(x: Any, ndigits: Any = None) -> Any:
+    # The digit count arrives as a Decimal literal
+    return round(decimal_value(x)) if ndigits is None else round(decimal_value(x), int(ndigits))
+
+def decimal_sqrt(x: Any) -> decimal.Decimal:
+    return decimal_value(x).sqrt()
+
+def decimal_exp(x: Any) -> decimal.Decimal:
+    return mp_exp(decimal_value(x))
+
+def decimal_log(x: Any, base: Any = None) -> decimal.Decimal:
+    if base is None:
+        return mp_log(decimal_value(x))
+    return mp_log(decimal_value(x)) / mp_log(decimal_value(base))
+
+def decimal_log10(x: Any) -> decimal.Decimal:
+    return mp_log(decimal_value(x)) / _ln10()
+
+def decimal_trig(f: Callable[[decimal.Decimal], decimal.Decimal], mode: str):
+    # Degrees are converted with pi at the working precision
+    if mode == "rad":
+        return lambda x: f(decimal_value(x))
+    def g(x: Any) -> decimal.Decimal:
+        with decimal.localcontext() as c:
+            c.prec += 5
+            r = decimal_value(x) * mp_pi() / 180
+        return f(r)
+    return g
+
+def decimal_atrig(f: Callable[[decimal.Decimal], decimal.Decimal], mode: str):
+    if mode == "rad":
+        return lambda x: f(decimal_value(x))
+    def g(x: Any) -> decimal.Decimal:
+        with decimal.localcontext() as c:
+            c.prec += 5
+            r = f(decimal_value(x)) * 180 / mp_pi()
+        return +r
+    return g
+
+def decimal_funcs(trig: TrigMode) -> Dict[str, Callable[..., Any]]:
+    return {
+        "abs": abs, "round": decimal_round, "floor": math.floor, "ceil": math.ceil,
+        "sqrt": decimal_sqrt, "exp": decimal_exp, "log": decimal_log, "log10": decimal_log10,
+        "sin": decimal_trig(mp_sin, trig.mode), "cos": decimal_trig(mp_cos, trig.mode),
+        "tan": decimal_trig(mp_tan, trig.mode),
+        "asin": decimal_atrig(mp_asin, trig.mode), "acos": decimal_atrig(mp_acos, trig.mode),
+        "atan": decimal_atrig(mp_atan, trig.mode),
+        "factorial": decimal_factorial, "factorial2": factorial2_exact,
+    }
+
+def decimal_factorial(x: Any) -> Any:
+    return decimal_value(factorial_exact(x))
+
+def decimal_factorial_ratio(a: Any, b: Any) -> Any:
+    m, n = _factorial_arg(a), _factorial_arg(b)
+    if m is not None and n is not None and m < n:
+        return 1 / decimal_value(factorial_ratio_exact(b, a))
+    return decimal_value(factorial_ratio_exact(a, b))
+
+FACTORIAL_RATIOS[decimal_factorial] = decimal_factorial_ratio
+
+DECIMAL_BINOPS: Dict[type, Callable[[Any, Any], Any]] = {
+    **BINOPS, ast.Div: decimal_truediv, ast.FloorDiv: decimal_floordiv,
+    ast.Mod: decimal_mod, ast.Pow: decimal_power,
+}
+
+def format_decimal(x: decimal.Decimal, precision: int) -> str:
+    if not x.is_finite():
+        return str(float(x))
+    ctx = decimal.Context(prec=precision)
+    r = ctx.plus(x)
+    if r == r.to_integral_value() and r.adjusted() < precision:
+        # Digits straight from the Decimal; int() text hits the int string limit
+        return format(r.to_integral_value(), "f") if r else "0"
+    return format(r.normalize(ctx), f".{precision}g")
+
+# ---------------- ADAPTIVE PRECISION ---------------- #
+
+_U = 2.0 ** -53  # unit roundoff of a float
+_TINY = 5e-324   # a rounding error that underflowed to zero
+# Refinement stops here even when the printed digits keep moving (sin(pi))
+ADAPTIVE_MAX_DIGITS = 1000
+
+class Bounded:
+    """
+    A float with a bound on its absolute error, for "adaptive" mode. Every
+    operation adds the error it propagates from its operands to its own
+    rounding error (exact for + and -, by TwoSum), so a result knows which
+    of its digits it can vouch for. Overflow, or a domain error that only
+    rounding could have caused, gives an infinite bound instead of an
+    error, and the expression is refined at higher precision. Values are
+    never modified once built, so literals are shared between evaluations.
+    """
+    __slots__ = ("value", "err")
+
+    def __init__(self, value: float, err: float = 0.0):
+        self.value = value
+        self.err = err
+
+    def __float__(self) -> float:
+        return self.value
+
+    def __repr__(self) -> str:
+        return f"Bounded({self.value!r}, {self.err!r})"
+
+    def resolves(self, precision: int) -> bool:
+        # True when every value within the bound prints the same at
+        # `precision` digits (see format_result)
+        v, e = self.value, self.err
+        if not e:
+            return True
+        if not (e < math.inf and math.isfinite(v)):
+            return False
+        scale = 10.0 ** -precision
+        if abs(v - round(v)) + e < scale:
+            return True  # shown as that integer
+        return e <= abs(v) * scale / 2
+
+    def __neg__(self):
+        return Bounded(-self.value, self.err)
+
+    def __pos__(self):
+        return self
+
+    def __abs__(self):
+        return Bounded(abs(self.value), self.err)
+
+    def __add__(self, other):
+        o = _bounded(other)
+        if o is None:
+            return NotImplemented
+        a, b = self.value, o.value
+        z = a + b
+        if not math.isfinite(z):
+            return _nonfinite(z, self, o)
+        # TwoSum: the rounding error of a + b, exactly
+        bb = z - a
+        return Bounded(z, self.err + o.err + abs((a - (z - bb)) + (b - bb)))
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        o = _bounded(other)
+        return NotImplemented if o is None else self + -o
+
+    def __rsub__(self, other):
+        o = _bounded(other)
+        return NotImplemented if o is None else o + -self
+
+    def __mul__(self, other):
+        o = _bounded(other)
+        if o is None:
+            return NotImplemented
+        a, b = self.value, o.value
+        z = a * b
+        if not math.isfinite(z):
+            return _nonfinite(z, self, o)
+        err = abs(a) * o.err + abs(b) * self.err + self.err * o.err
+        return Bounded(z, err + (_rounding(z) if z or not (a and b) else _TINY))
+
+    __rmul__ = __mul__
+
+    def __truediv__(self, other):
+        o = _bounded(other)
+        return NotImplemented if o is None else _divide(self, o)
+
+    def __rtruediv__(self, other):
+        o = _bounded(other)
+        return NotImplemented if o is None else _divide(o, self)
+
+    def __floordiv__(self, other):
+        o = _bounded(other)
+        return NotImplemented if o is None else _floor_divide(self, o)[0]
+
+    def __rfloordiv__(self, other):
+        o = _bounded(other)
+        return NotImplemented if o is None else _floor_divide(o, self)[0]
+
+    def __mod__(self, other):
+        o = _bounded(other)
+        return NotImplemented if o is None else _modulo(self, o)
+
+    def __rmod__(self, other):
+        o = _bounded(other)
+        return NotImplemented if o is None else _modulo(o, self)
+
+    def __pow__(self, other):
+        o = _bounded(other)
+        return NotImplemented if o is None else _power(self, o)
+
+    def __rpow__(self, other):
+        o = _bounded(other)
+        return NotImplemented if o is None else _power(o, self)
+
+    def _integral(self, f: Callable[[float], int]) -> Bounded:
+        # floor, ceil, round: exact unless the bound straddles a step
+        v, e = self.value, self.err
+        z = float(f(v))
+        if e and not (e < math.inf and f(v - e) == f(v + e)):
+            return Bounded(z, math.inf)
+        return Bounded(z)
+
+    def __floor__(self):
+        return self._integral(math.floor)
+
+    def __ceil__(self):
+        return self._integral(math.ceil)
+
+    def __round__(self, ndigits=None):
+        if ndigits is None:
+            return self._integral(round)
+        n = _bounded(ndigits)
+        z = round(self.value, int(n.value))
+        return Bounded(z, math.inf if self.err or n.err else _rounding(z))
+
+def _bounded(x: Any) -> Bounded | None:
+    # Plain numbers (ans, mem, folded constants) are taken as exact
+    if type(x) is Bounded:
+        return x
+    try:
+        f = float(x)
+    except OverflowError:
+        return Bounded(math.copysign(math.inf, x), math.inf)
+    except TypeError:
+        return None
+    if f == x or f != f:
+        return Bounded(f)
+    return Bounded(f, abs(f) * _U if math.isfinite(f) else math.inf)
+
+def _rounding(z: float) -> float:
+    # Bound on the rounding error of one correctly rounded operation giving z
+    return abs(z) * _U if z else 0.0
+
+def _nonfinite(z: float, *operands: Bounded) -> Bounded:
+    # inf + 1 is as exact as its operands; finite operands overflowing is not
+    if all(math.isfinite(o.value) for o in operands) or any(o.err for o in operands):
+        return Bounded(z, math.inf)
+    return Bounded(z)
+
+def _divide(x: Bounded, y: Bounded) -> Bounded:
+    a, b = x.value, y.value
+    if not b and y.err:
+        return Bounded(math.nan, math.inf)  # a zero that may only be rounding
+    z = a / b
+    if not math.isfinite(z):
+        return _nonfinite(z, x, y)
+    if y.err >= abs(b):
+        return Bounded(z, math.inf)
+    return Bounded(z, (x.err + abs(z) * y.err) / (abs(b) - y.err) + _rounding(z))
+
+def _floor_divide(x: Bounded, y: Bounded) -> tuple:
+    # (a // b, a // b as a float); inexact only if the bound straddles an integer
+    if not y.value and y.err:
+        return Bounded(math.nan, math.inf), math.nan
+    q = x.value // y.value
+    if x.err or y.err:
+        t = _divide(x, y)
+        if not (t.err < math.inf and math.floor(t.value - t.err) == math.floor(t.value + t.err)):
+            return Bounded(q, math.inf), q
+    return Bounded(q), q
+
+def _modulo(x: Bounded, y: Bounded) -> Bounded:
+    # a % b = a - b * (a // b)
+    quotient, q = _floor_divide(x, y)
+    r = x.value % y.value
+    if quotient.err:
+        return Bounded(r, math.inf)
+    return Bounded(r, x.err + abs(q) * y.err + _rounding(r))
+
+def _power(x: Bounded, y: Bounded) -> Any:
+    a, b, ea, eb = x.value, y.value, x.err, y.err
+    try:
+        z = a ** b
+    except OverflowError:
+        return Bounded(math.inf, math.inf)
+    except ZeroDivisionError:
+        if ea:
+            return Bounded(math.nan, math.inf)
+        raise
+    if isinstance(z, complex):
+        return z  # as in float mode
+    if not math.isfinite(z):
+        return _nonfinite(z, x, y)
+    try:
+        if not (ea or eb):
+            err = 0.0
+        elif not eb and b.is_integer():
+            # |(a+d)**b - a**b| <= |z| * ((1 + |d/a|)**|b| - 1) for integral b
+            if not a:
+                err = ea ** b if b > 0 else (0.0 if b == 0 else math.inf)
+            elif b >= 0:
+                err = abs(z) * math.expm1(b * math.log1p(ea / abs(a)))
+            else:
+                err = abs(z) * math.expm1(b * math.log1p(-ea / abs(a))) if ea < abs(a) else math.inf
+        elif a > ea:
+            # log z = b log a moves by at most |b| da + eb (|log a| + da)
+            da = -math.log1p(-ea / a)
+            err = abs(z) * math.expm1(abs(b) * da + eb * (abs(math.log(a)) + da))
+        else:
+            err = math.inf
+    except OverflowError:
+        err = math.inf
+    # Exactly representable integer powers come back exact
+    if a.is_integer() and b.is_integer() and b >= 0 and abs(z) < 2.0 ** 53:
+        return Bounded(z, err)
+    return Bounded(z, err + 2 * _rounding(z))
+
+def bounded_literal(value: Any) -> Bounded:
+    # A literal carries its own conversion error: 0.1 is not a float
+    x = _bounded(value)
+    if x is None:
+        raise TypeError(f"unsupported literal: {value!r}")
+    if (isinstance(value, float) and math.isfinite(value) and not x.err
+            and decimal.Decimal(repr(value)) != decimal.Decimal(value)):
+        # A literal that underflowed to 0 is refined however small it is
+        return Bounded(x.value, math.ulp(value) / 2 if value else math.inf)
+    if isinstance(value, Literal) and not math.isfinite(value):
+        return Bounded(x.value, math.inf)  # past the float range: refined
+    return x
+
+def bounded_store(value: Any) -> Any:
+    # A refined result keeps the digits a float cannot hold
+    f = float(value)
+    return value if isinstance(value, decimal.Decimal) and f != value else f
+
+def _bounded_call(f: Callable[[float], float], bound: Callable[[float, float, float], float]):
+    # f of a Bounded; bound(x, e, z) is the error propagated from e. The
+    # math functions are accurate to within an ulp.
+    def g(x: Any) -> Bounded:
+        x = _bounded(x)
+        v, e = x.value, x.err
+        try:
+            z = f(v)
+        except OverflowError:
+            return Bounded(math.inf, math.inf)
+        except ValueError:
+            if e:
+                return Bounded(math.nan, math.inf)  # maybe only rounding left the domain
+            raise
+        try:
+            err = bound(v, e, z) if e else 0.0
+        except (OverflowError, ValueError, ZeroDivisionError):
+            err = math.inf
+        return Bounded(z, err + 2 * _rounding(z))
+    return g
+
+def _tan_bound(x: float, e: float, z: float) -> float:
+    # No pole within the bound: tan' = 1 + tan**2 is largest at an end
+    lo, hi = math.cos(x - e), math.cos(x + e)
+    if e >= 1.0 or lo * hi <= 0 or lo * math.cos(x) <= 0:
+        return math.inf
+    t = max(abs(math.tan(x - e)), abs(math.tan(x + e)), abs(z))
+    return e * (1 + t * t)
+
+def _asin_bound(x: float, e: float, z: float) -> float:
+    m = abs(x) + e
+    return e / math.sqrt(1 - m * m) if m < 1 else math.inf
+
+_bounded_log = _bounded_call(math.log, lambda x, e, z: -math.log1p(-e / x) if x > e else math.inf)
+
+def bounded_log(x: Any, base: Any = None) -> Bounded:
+    if base is None:
+        return _bounded_log(x)
+    return _bounded_log(x) / _bounded_log(base)
+
+def bounded_factorial(x: Any) -> Bounded:
+    # Exact for an exact integer; gamma gets no bound
+    x = _bounded(x)
+    try:
+        z = factorial_safe(x.value)
+    except OverflowError:
+        return Bounded(math.inf, math.inf)
+    if x.err or not x.value.is_integer():
+        return Bounded(z, math.inf)
+    return Bounded(z, _rounding(z))
+
+def bounded_fallback(f: Callable[..., Any]) -> Callable[..., Any]:
+    # Functions without an error bound: the result is never trusted
+    def g(*args: Any) -> Any:
+        try:
+            return Bounded(float(f(*map(float, args))), math.inf)
+        except OverflowError:
+            return Bounded(math.inf, math.inf)
+    return g
+
+_DEGREE = 180 / math.pi
+
+def _bounded_degrees_in(f: Callable[[Bounded], Bounded]) -> Callable[[Any], Bounded]:
+    def g(x: Any) -> Bounded:
+        x = _bounded(x)
+        r = math.radians(x.value)
+        return f(Bounded(r, x.err / _DEGREE + 3 * _rounding(r)))
+    return g
+
+def _bounded_degrees_out(f: Callable[[Any], Bounded]) -> Callable[[Any], Bounded]:
+    def g(x: Any) -> Bounded:
+        z = f(x)
+        d = math.degrees(z.value)
+        return Bounded(d, z.err * _DEGREE + 3 * _rounding(d))
+    return g
+
+_BOUNDED_TRIG = {
+    "sin": _bounded_call(math.sin, lambda x, e, z: min(e, 2.0)),
+    "cos": _bounded_call(math.cos, lambda x, e, z: min(e, 2.0)),
+    "tan": _bounded_call(math.tan, _tan_bound),
+}
+_BOUNDED_ATRIG = {
+    "asin": _bounded_call(math.asin, _asin_bound),
+    "acos": _bounded_call(math.acos, _asin_bound),
+    "atan": _bounded_call(math.atan, lambda x, e, z: e),
+}
+
+def adaptive_funcs(trig: TrigMode) -> Dict[str, Callable[..., Any]]:
+    funcs: Dict[str, Callable[..., Any]] = {
+        "abs": abs, "round": round, "floor": math.floor, "ceil": math.ceil,
+        "sqrt": _bounded_call(math.sqrt, lambda x, e, z: e / (math.sqrt(x - e) + z) if x > e else math.sqrt(x + e)),
+        "exp": _bounded_call(math.exp, lambda x, e, z: z * math.expm1(e)),
+        "log": bounded_log,
+        "log10": _bounded_call(math.log10, lambda x, e, z: -math.log1p(-e / x) / math.log(10) if x > e else math.inf),
+        "factorial": bounded_factorial,
+    }
+    if trig.mode == "deg":
+        funcs.update({k: _bounded_degrees_in(f) for k, f in _BOUNDED_TRIG.items()})
+        funcs.update({k: _bounded_degrees_out(f) for k, f in _BOUNDED_ATRIG.items()})
+    else:
+        funcs.update(_BOUNDED_TRIG)
+        funcs.update(_BOUNDED_ATRIG)
+    return funcs
+
+# ---------------- COMPLEX NUMBERS ---------------- #
+
+def complex_literal(value: Any) -> Any:
+    return value if type(value) is complex else float(value)
+
+def complex_store(value: Any) -> Any:
+    # A complex result with no imaginary part is stored as a real one;
+    # exact and decimal values carried in by `mode complex` become floats,
+    # which mix with complex values
+    if type(value) is complex and not value.imag:
+        return value.real
+    if isinstance(value, (Rational, decimal.Decimal)):
+        return float(value)
+    return value
+
+def check_real(value: Any, numbers: NumberMode) -> Any:
+    # Only mode complex has complex results; elsewhere (-8)^(1/3) is a
+    # domain error, as it is for math.pow
+    if type(value) is complex and not numbers.imaginary:
+        raise ValueError("math domain error")
+    return value
+
+def complex_call(f: Callable[..., Any], cf: Callable[..., Any]) -> Callable[..., Any]:
+    # math for real arguments; cmath for complex ones and past the end of
+    # math's real domain (sqrt(-1), log(-2), asin(2))
+    def g(x: Any, *args: Any) -> Any:
+        if type(x) is not complex:
+            try:
+                return f(x, *args)
+            except (ValueError, TypeError):
+                pass
+        return cf(x, *args)
+    return g
+
+def _complex_radians(x: Any) -> Any:
+    return x * (math.pi / 180) if type(x) is complex else math.radians(x)
+
+def _complex_degrees(x: Any) -> Any:
+    return x * (180 / math.pi) if type(x) is complex else math.degrees(x)
+
+def complex_funcs(trig: TrigMode) -> Dict[str, Callable[..., Any]]:
+    funcs: Dict[str, Callable[..., Any]] = {
+        "sqrt": complex_call(math.sqrt, cmath.sqrt), "exp": complex_call(math.exp, cmath.exp),
+        "log": complex_call(math.log, cmath.log), "log10": complex_call(math.log10, cmath.log10),
+    }
+    for name in ("sin", "cos", "tan"):
+        f = complex_call(getattr(math, name), getattr(cmath, name))
+        funcs[name] = f if trig.mode == "rad" else (lambda f: lambda x: f(_complex_radians(x)))(f)
+    for name in ("asin", "acos", "atan"):
+        f = complex_call(getattr(math, name), getattr(cmath, name))
+        funcs[name] = f if trig.mode == "rad" else (lambda f: lambda x: _complex_degrees(f(x)))(f)
+    return funcs
+
+def format_complex(z: complex, precision: int) -> str:
+    # Each part as format_result prints a float; a part that prints as 0 is dropped
+    re_s = format_result(z.real, precision)
+    im_s = format_result(z.imag, precision)
+    if im_s == "0":
+        return re_s
+    if re_s == "0":
+        return f"{im_s}j"
+    sign = "" if im_s.startswith("-") else "+"
+    return f"{re_s}{sign}{im_s}j"
+
+# ---------------- MAIN PROGRAM ---------------- #
+
+def build_env(trig: TrigMode, ans: float, mem: float, numbers: str = "float"):
+    # names (constants + variables)
+    names = {**CONSTANTS, "ans": ans, "mem": mem}
+
+    # functions
+    funcs: Dict[str, Callable[..., float]] = {
+        # basic math
+        "abs": abs, "round": round,
+        "floor": math.floor, "ceil": math.ceil,
+        "sqrt": math.sqrt, "exp": math.exp,
+        "log": math.log, "log10": math.log10,
+
+        # trig (respect mode)
+        "sin": trig.wrap_trig(math.sin),
+        "cos": trig.wrap_trig(math.cos),
+        "tan": trig.wrap_trig(math.tan),
+        "asin": trig.wrap_atrig(math.asin),
+        "acos": trig.wrap_atrig(math.acos),
+        "atan": trig.wrap_atrig(math.atan),
+
+        # factorial (gamma(x+1) for non-integers) and double factorial
+        "factorial": factorial_safe,
+        "factorial2": factorial2_safe,
+        "gamma": math.gamma, "lgamma": math.lgamma,
+    }
+    mode = NUMBER_MODES[numbers]
+    if mode.wrap is not None:
+        funcs = {k: mode.wrap(f) for k, f in funcs.items()}
+    funcs.update(mode.funcs(trig) if callable(mode.funcs) else mode.funcs)
+    return names, funcs
+
+def sqrt_exact(x: Any) -> Any:
+    # Perfect squares keep an exact root; anything else goes through float
+    if type(x) is int and x >= 0:
+        r = math.isqrt(x)
+        if r * r == x:
+            return r
+    return math.sqrt(x)
+
+# Functions whose result depends only on their arguments (rad-mode trig are
+# the plain math functions; deg-mode wrappers are rebuilt per environment)
+PURE_FUNCS = {
+    abs, round, math.floor, math.ceil, math.sqrt, math.exp, math.log, math.log10,
+    math.sin, math.cos, math.tan, math.asin, math.acos, math.atan,
+    factorial_safe, factorial2_safe, factorial_exact, factorial2_exact, sqrt_exact,
+    sqrt_rational, rational_factorial, math.gamma, math.lgamma,
+}
+
+# Integer literals and integer-only subexpressions stay Python ints in "int"
+# mode; a float operand or a non-integral quotient promotes to float
+NUMBER_MODES: Dict[str, NumberMode] = {
+    "float": FLOAT_NUMBERS,
+    "int": NumberMode("int", int_literal, INT_BINOPS, {
+        "factorial": factorial_exact, "factorial2": factorial2_exact, "sqrt": sqrt_exact,
+    }, big_ints=True),
+    # As int, plus exact fractions: 1/3 stays 1/3 and 0.1 reads as 1/10
+    "exact": NumberMode("exact", exact_literal, EXACT_BINOPS, {
+        "factorial": rational_factorial, "factorial2": factorial2_exact, "sqrt": sqrt_rational,
+    }, store=exact_store, fold_names=False, big_ints=True),
+    # Every value a Decimal at the session precision (plus guard digits)
+    "decimal": NumberMode("decimal", decimal_value, DECIMAL_BINOPS, decimal_funcs,
+        fold_names=False, big_ints=True, wrap=decimal_fallback,
+        context=decimal_context, constants=decimal_constants),
+    # Floats with an error bound; refined in decimal only when the bound
+    # could change a printed digit, as in (1e16+1)-1e16
+    "adaptive": NumberMode("adaptive", bounded_literal, funcs=adaptive_funcs,
+        store=bounded_store, wrap=bounded_fallback, refine="decimal"),
+    # Imaginary literals; functions go to cmath only for complex arguments
+    "complex": NumberMode("complex", complex_literal, funcs=complex_funcs,
+        store=complex_store, imaginary=True),
+}
+TRIG_MODES = ("rad", "deg")
+
+def max_precision(numbers: NumberMode) -> int:
+    # Digits beyond a float's are only real where computation is in Decimal
+    return DECIMAL_MAX_PRECISION if numbers.context else 50
+NUMBER_TYPES = (int, float, complex, Rational, decimal.Decimal)
+
+class Env:
+    """
+    Long-lived evaluation environment. The function table for each (trig
+    mode, number mode) pair is built once, on first use; switching modes is
+    a table swap and ans/mem are updated in place. Compiled expressions are
+    cached per table. Modes with a working precision evaluate under a
+    decimal context for self.precision digits, with matching pi, e, tau.
+    """
+    def __init__(self, mode: str = "rad", ans: float = 0.0, mem: float = 0.0,
+                 numbers: str = "float", precision: int = 12):
+        self.names, _ = build_env(TrigMode("rad"), ans, mem)
+        self.tables: Dict[tuple, Dict[str, Callable[..., Any]]] = {}
+        self.compiled: Dict[tuple, ExprCache] = {}
+        self.limits = Limits()
+        self.budget: float | None = DEFAULT_COST_BUDGET
+        self.mode = "rad"
+        self.numbers = FLOAT_NUMBERS
+        self.precision = precision
+        self.context: decimal.Context | None = None
+        self.set_mode(mode)
+        self.set_numbers(numbers)
+
+    def _compiled_cache(self, funcs: Dict[str, Callable[..., float]],
+                        numbers: NumberMode) -> ExprCache:
+        # (evaluator, cost check to run with the budget, or None if always
+        # cheap). A line seen once is walked; compiling it costs more than
+        # a single walk saves, so only lines seen again are compiled.
+        def load(expr: str):
+            tree = expr_cache.get(expr)
+            fn = interpret_expr(tree, funcs, limits=self.limits, numbers=numbers)
+            return fn, self._cost_check(tree, numbers)
+
+        def promote(expr: str):
+            tree = expr_cache.get(expr)
+            fn = compile_expr(tree, funcs, limits=self.limits, numbers=numbers)
+            return fn, self._cost_check(tree, numbers)
+        return ExprCache(load, promote=promote)
+
+    def _cost_check(self, tree: ast.AST, numbers: NumberMode) -> Callable[[float], None] | None:
+        expensive, used = scan_tree(tree)
+        if not expensive:
+            return None
+        read = [name for name in used if name not in CONSTANTS]
+        names = self.names
+        if not numbers.big_ints:
+            # Without big ints no literal is an integer; only an
+            # integer-valued name (an exact ans kept from int mode) can
+            # make integer work
+            if not read:
+                return None
+            def check(budget: float):
+                if any(type(names.get(name)) is int for name in read):
+                    check_cost(tree, names, budget, numbers)
+            return check
+        if not read:
+            # Only literals and constants: the estimate never changes
+            work = estimate_cost(tree, names, numbers)
+            return lambda budget: check_work(work, budget)
+        return lambda budget: check_cost(tree, names, budget, numbers)
+
+    def _table(self, numbers: NumberMode) -> tuple:
+        # (function table, compiled cache) for the trig mode and `numbers`
+        key = (self.mode, numbers.name)
+        if key not in self.tables:
+            self.tables[key] = build_env(TrigMode(self.mode), 0.0, 0.0, numbers.name)[1]
+        if key not in self.compiled:
+            self.compiled[key] = self._compiled_cache(self.tables[key], numbers)
+        return self.tables[key], self.compiled[key]
+
+    def _select(self):
+        self.funcs, self._compiled = self._table(self.numbers)
+        numbers = self.numbers
+        self.context = numbers.context(self.precision) if numbers.context else None
+        self.names.update(numbers.constants(self.precision) if numbers.constants else CONSTANTS)
+
+    @property
+    def ans(self) -> float:
+        return self.names["ans"]
+
+    @ans.setter
+    def ans(self, value: float):
+        self.names["ans"] = value
+
+    @property
+    def mem(self) -> float:
+        return self.names["mem"]
+
+    @mem.setter
+    def mem(self, value: float):
+        self.names["mem"] = value
+
+    def set_mode(self, mode: str):
+        m = mode.lower()
+        if m not in TRIG_MODES:
+            raise ValueError("Mode must be 'rad' or 'deg'.")
+        self.mode = m
+        self._select()
+
+    def set_int_bits(self, bits: int | None):
+        # Folded constants were checked against the old cap, so recompile
+        self.limits.max_int_bits = bits
+        self.compiled.clear()
+        self._select()
+
+    def set_numbers(self, numbers: str) -> list:
+        # Returns the names (ans, mem, jobN) reset to 0 because they held a
+        # complex value the new mode cannot represent
+        n = numbers.lower()
+        if n not in NUMBER_MODES:
+            raise ValueError(f"Number mode must be one of: {', '.join(NUMBER_MODES)}.")
+        self.numbers = NUMBER_MODES[n]
+        reset = []
+        for k in [k for k in self.names if k not in CONSTANTS]:
+            v = self.names[k]
+            if type(v) is complex and not self.numbers.imaginary:
+                self.names[k] = self.result(0)
+                reset.append(k)
+                continue
+            self.names[k] = self.carry(v)
+        self._select()
+        return reset
+
+    def carry(self, value: Any) -> Any:
+        # A value from another number mode (ans/mem across `mode`, a job
+        # result) as this mode stores it; integral values carry over
+        # exactly into integer arithmetic
+        if type(value) is complex and not self.numbers.imaginary:
+            return value
+        try:
+            exact = self.numbers.is_exact_int(1) and isinstance(value, float) and value.is_integer()
+            return int(value) if exact else self.result(value)
+        except OverflowError:
+            return value  # too large for a float; kept as an exact int
+
+    def set_precision(self, digits: int):
+        self.precision = digits
+        self._select()
+
+    def arithmetic(self):
+        # Context for arithmetic on values of the current number mode
+        if self.context is not None:
+            return decimal.localcontext(self.context)
+        return contextlib.nullcontext()
+
+    def result(self, value: Any) -> Any:
+        # A computed value as stored in ans/mem under the current number mode
+        with self.arithmetic():
+            return self.numbers.store(value)
+
+    def evaluate(self, expr: str) -> Any:
+        fn, check = self._compiled.get(expr)
+        if check is not None and self.budget is not None:
+            check(self.budget)
+        with self.arithmetic():
+            value = check_real(evaluate_limited(fn, self.names, self.limits), self.numbers)
+        if type(value) is Bounded:
+            return value.value if value.resolves(self.precision) else self._refine(expr)
+        return value
+
+    def _refine(self, expr: str) -> Any:
+        # Re-evaluate at rising precision until two runs print the same
+        refine = self.numbers.refine
+        numbers = NUMBER_MODES[refine] if refine else self.numbers
+        context, constants = numbers.context, numbers.constants
+        if context is None or constants is None:
+            raise ValueError(f"Number mode {numbers.name} has no working precision.")
+        fn, check = self._table(numbers)[1].get(expr)
+        if check is not None and self.budget is not None:
+            check(self.budget)
+        digits, last = 2 * self.precision, None
+        while True:
+            with decimal.localcontext(context(digits)):
+                # ans, mem and jobN too, or a float ans would meet Decimals
+                names = {k: decimal_value(v) if isinstance(v, (int, float, Rational)) else v
+                         for k, v in self.names.items()}
+                names.update(constants(digits))
+                value = evaluate_limited(fn, names, self.limits)
+            shown = format_result(value, self.precision)
+            if shown == last or digits >= ADAPTIVE_MAX_DIGITS:
+                return value
+            digits, last = 2 * digits, shown
+
+    def reset(self):
+        self.budget = DEFAULT_COST_BUDGET
+        defaults = Limits()
+        self.limits.timeout = defaults.timeout
+        self.set_int_bits(defaults.max_int_bits)
+        self.set_mode("rad")
+        self.precision = 12
+        self.set_numbers("float")
+        self.ans = 0.0
+        self.mem = 0.0
+
+# ---------------- BACKGROUND JOBS ---------------- #
+
+def _job_main(conn, expr: str, mode: str, numbers: str, precision: int,
+              names: Dict[str, Any], max_int_bits: int | None):
+    # Runs in the job's own process, which is what makes `kill` possible, so
+    # there is no time limit or cost budget and big integers stay in-process
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    env = Env(mode, numbers=numbers, precision=precision)
+    env.names.update(names)
+    env.budget = None
+    env.limits.timeout = None
+    env.limits.offload_bits = math.inf
+    env.limits.max_int_bits = max_int_bits
+    try:
+        conn.send((True, env.evaluate(expr)))
+    except BaseException as e:
+        conn.send((False, describe_error(e)))
+    finally:
+        conn.close()
+
+class Job:
+    """One expression evaluating in a background process."""
+    def __init__(self, number: int, expr: str, env: Env):
+        import multiprocessing
+        self.number = number
+        self.expr = expr
+        self.status = "running"  # running | done | failed | killed
+        self.reported = False     # set once the session has announced the outcome
+        self.result: Any = None
+        self.started = time.monotonic()
+        self.finished: float | None = None
+        snapshot = {k: v for k, v in env.names.items() if k not in CONSTANTS}
+        self.conn, send = multiprocessing.Pipe(duplex=False)
+        self.process = multiprocessing.Process(
+            target=_job_main,
+            args=(send, expr, env.mode, env.numbers.name, env.precision, snapshot,
+                  env.limits.max_int_bits),
+            daemon=True)
+        self.process.start()
+        send.close()
+
+    @property
+    def name(self) -> str:
+        # Variable the result is bound to once the job is done
+        return f"job{self.number}"
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished or time.monotonic()) - self.started
+
+    def poll(self, timeout: float = 0.0) -> bool:
+        """Collect the result if it is ready. Returns True once the job has ended."""
+        if self.status != "running":
+            return True
+        try:
+            if not self.conn.poll(timeout):
+                return False
+            ok, value = self.conn.recv()
+        except (EOFError, OSError):
+            ok, value = False, "job process exited unexpectedly."
+        self.status, self.result = ("done" if ok else "failed"), value
+        self._finish()
+        return True
+
+    def kill(self):
+        if self.status == "running":
+            self.process.terminate()
+            self.status = "killed"
+            self._finish()
+
+    def _finish(self):
+        self.finished = time.monotonic()
+        self.conn.close()
+        self.process.join()
+
+def print_help(file=None):
+    msg = """
+Commands:
+  help             Show this help
+  history          Show recent results
+  clear            Clear the screen (prints blank lines)
+  mode deg|rad     Set trig mode (default: rad)
+  mode float|int|exact|decimal|adaptive|complex
+                   Set number mode: int keeps integer arithmetic exact, exact
+                   also keeps fractions exact (1/3+1/6 = 1/2), decimal computes
+                   at the current precision, trig included, adaptive computes
+                   in float and redoes in decimal only results whose rounding
+                   error could show in the printed digits, complex accepts 2j
+                   and gives sqrt(-1) = 1j (default: float)
+  precision N      Set digits printed (default: 12); in mode decimal, also
+                   the digits computed (up to 100000)
+  full [FILE]      Print ans with every digit, or write the digits to FILE
+  m+ [x]           Add x (or ans if omitted) to memory
+  m- [x]           Subtract x (or ans if omitted) from memory
+  mr               Print memory value
+  mc               Clear memory (set to 0)
+  reset            Reset ans, mem, mode, precision, history
+  cache            Show parse and compiled expression cache statistics
+  budget N|off     Refuse expressions estimated above N bits of big-integer work
+  timeout S|off    Abort any evaluation running longer than S seconds (default: 10)
+  intbits N|off    Largest integer result allowed, in bits (default: 2^27)
+  bg EXPR          Evaluate EXPR in the background; its result becomes jobN
+  jobs             List background jobs with elapsed time and results
+  wait [N]         Wait for job N (or all jobs); Ctrl+C stops waiting
+  kill N           Stop job N
+  quit / exit      Leave the calculator
+
+Usage:
+  - Enter math expressions directly:
+      2+2, 2*(3+4)^2, 5!, 7!!, 2.5!, gamma(0.5), sqrt(2), log(8,2), ln(5) -> use 'log(5)' for natural log
+      sin(30) with mode deg OR sin(pi/6) with mode rad
+      2pi, 3(4+1), (1+2)(3+4) -> implicit multiplication
+  - Variables:
+      ans (last answer), mem (memory register)
+  - Ctrl+C while a calculation runs cancels it; ans, mem and history are kept.
+  - Batch mode (no prompts):
+      calculator.py -e EXPR [-e EXPR ...]   calculator.py -f FILE   ... | calculator.py
+      calculator.py -f FILE -j 8   -> spread independent lines over 8 processes
+      calculator.py --csv data.csv -e "price*qty" [--where "qty"] [--column total]
+    """
+    print(msg.strip(), file=file)
+
+def format_result(x: float, precision: int) -> str:
+    # Nicely format floats; show integers without decimal when exact
+    if type(x) is int:
+        return format_int(x, precision)
+    if type(x) is Rational:
+        return format_rational(x, precision)
+    if isinstance(x, decimal.Decimal):
+        return format_decimal(x, precision)
+    if type(x) is complex:
+        return format_complex(x, precision)
+    if math.isfinite(x):
+        if abs(x - int(x)) < 10**(-precision):
+            return str(int(round(x)))
+        return f"{x:.{precision}g}"
+    return str(x)
+
+class Session:
+    """
+    Calculator state (environment, precision, history) and line handling,
+    shared by the interactive prompt and batch mode.
+    """
+    def __init__(self, out: Any = None):
+        self.out = out if out is not None else sys.stdout
+        self.env = Env("rad")
+        self.precision = 12
+        self.history: list = []  # list[(expr, result)]
+        self.errors = 0
+        self.jobs: Dict[int, Job] = {}
+
+    def emit(self, text: str):
+        self.out.write(text + "\n")
+
+    def show_result(self, x: float):
+        self.emit(format_result(x, self.precision))
+
+    def plain(self, x: Any) -> str:
+        # Unrounded text for history and messages; huge ints are abbreviated,
+        # and Decimals show every digit they hold, formatted as results are
+        if isinstance(x, decimal.Decimal):
+            return format_decimal(x, max(self.precision, len(x.as_tuple().digits)))
+        return format_result(x, self.precision) if type(x) in (int, Rational) else str(x)
+
+    def error(self, text: str):
+        self.errors += 1
+        self.emit(text)
+
+    def describe_job(self, job: Job) -> str:
+        head = f"[{job.number}] {job.status:<7} {job.elapsed:7.1f}s  {job.expr}"
+        if job.status == "done":
+            return f"{head}  =  {format_result(job.result, self.precision)}  ({job.name})"
+        if job.status == "failed":
+            return f"{head}  Error: {job.result}"
+        return head
+
+    def check_jobs(self, quiet: bool = False):
+        # Report jobs that ended since the last line and bind their results;
+        # `jobs` passes quiet, as its listing reports them anyway
+        for job in self.jobs.values():
+            if not job.reported and job.poll():
+                job.reported = True
+                if job.status == "done":
+                    self.env.names[job.name] = self.env.carry(job.result)
+                if not quiet:
+                    self.emit(self.describe_job(job))
+
+    def wait_job(self, job: Job):
+        # Ctrl+C stops waiting; the job itself keeps running
+        ticker = getattr(self.out, "isatty", lambda: False)()
+        while not job.poll(0.25):
+            if ticker:
+                self.out.write(f"\r[{job.number}] running {job.elapsed:7.1f}s")
+                self.out.flush()
+        if ticker:
+            self.out.write("\r")
+
+    def job_command(self, lower: str, line: str):
+        parts = lower.split()
+        if parts[0] == "bg":
+            expr = line.strip()[2:].strip()
+            if not expr:
+                self.error("Usage: bg EXPR")
+                return
+            number = max(self.jobs, default=0) + 1
+            job = self.jobs[number] = Job(number, expr, self.env)
+            self.emit(f"[{number}] started: {expr}")
+            return
+        if parts[0] == "jobs":
+            self.check_jobs(quiet=True)
+            for job in self.jobs.values():
+                self.emit(self.describe_job(job))
+            if not self.jobs:
+                self.emit("(no jobs)")
+            return
+        targets = list(self.jobs.values())
+        if len(parts) == 2:
+            target = self.jobs.get(int(parts[1])) if parts[1].isdigit() else None
+            if target is None:
+                self.error(f"No such job: {parts[1]}")
+                return
+            targets = [target]
+        elif len(parts) != 1 or parts[0] == "kill":
+            self.error(f"Usage: {parts[0]} N")
+            return
+        if parts[0] == "kill":
+            targets[0].kill()
+            self.check_jobs()
+            return
+        for job in targets:
+            self.wait_job(job)
+        # `wait N` shows a job reported on an earlier line again; anything
+        # that ended while waiting is reported once by check_jobs
+        if len(parts) == 2 and targets[0].reported:
+            self.emit(self.describe_job(targets[0]))
+        self.check_jobs()
+
+    def execute(self, line: str) -> bool:
+        """Run one input line. Returns False when the user asked to quit."""
+        line = line.strip()
+        # Job commands report finished jobs themselves
+        if self.jobs and line.lower().split(" ", 1)[0] not in ("jobs", "wait", "kill"):
+            self.check_jobs()
+        if not line:
+            return True
+        env = self.env
+
+        # Commands
+        lower = line.lower()
+        if lower in ("quit", "exit"):
+            return False
+        if lower == "help":
+            print_help(self.out)
+            return True
+        if lower == "history":
+            if not self.history:
+                self.emit("(no history)")
+            else:
+                for i, (e, r) in enumerate(self.history[-20:], 1):  # last 20
+                    self.emit(f"{i:>2}: {e}  =  {self.plain(r)}")
+            return True
+        if lower.startswith("clear"):
+            self.emit("\n" * 60)
+            return True
+        try:
+            setting = parse_setting(line)
+        except ValueError as e:
+            self.error(str(e))
+            return True
+        if setting is not None:
+            self.apply_setting(*setting)
+            return True
+        if lower == "mr":
+            self.show_result(env.mem)
+            return True
+        if lower == "mc":
+            env.mem = env.result(0)
+            self.emit("Memory cleared.")
+            return True
+        if lower.startswith("m+") or lower.startswith("m-"):
+            op = line[:2].lower()  # 'm+' or 'm-'
+            arg = line[2:].strip()
+            if arg == "":
+                delta = env.ans
+            else:
+                # Evaluate arg with current env
+                try:
+                    delta = env.result(env.evaluate(arg))
+                except Exception as e:
+                    self.error(f"Memory op error: {e}")
+                    return True
+            mem = env.mem
+            arithmetic = env.arithmetic()
+            if isinstance(mem, decimal.Decimal) is not isinstance(delta, decimal.Decimal):
+                # Adaptive mode: a refined result meets a float
+                mem, delta = decimal_value(mem), decimal_value(delta)
+                arithmetic = decimal.localcontext(decimal_context(env.precision))
+            try:
+                with arithmetic:
+                    env.mem = env.result(mem + delta if op == "m+" else mem - delta)
+            except Exception as e:
+                self.error(f"Memory op error: {e}")
+                return True
+            self.emit(f"Memory = {self.plain(env.mem)}")
+            return True
+        if lower == "cache":
+            self.emit(f"Parse cache: {expr_cache}")
+            for (trig, numbers), cache in env.compiled.items():
+                self.emit(f"Compiled ({trig}, {numbers}): {cache}")
+            return True
+        if lower == "full" or lower.startswith("full "):
+            self.write_full(line.strip()[4:].strip())
+            return True
+        if lower in ("jobs", "wait", "kill", "bg") or lower.startswith(("bg ", "wait ", "kill ")):
+            self.job_command(lower, line)
+            return True
+        # Evaluate math expression
+        try:
+            self.record(line, env.evaluate(line))
+        except Exception as e:
+            self.error(f"Error: {describe_error(e)}")
+        return True
+
+    def apply_setting(self, name: str, value: Any):
+        # A setting as read by parse_setting
+        env = self.env
+        if name == "mode" and value in NUMBER_MODES:
+            reset = env.set_numbers(value)
+            self.precision = min(self.precision, max_precision(env.numbers))
+            env.set_precision(self.precision)
+            self.emit(f"Number mode set to {env.numbers.name}.")
+            if reset:
+                self.emit(f"Complex {' and '.join(reset)} reset to 0.")
+        elif name == "mode":
+            env.set_mode(value)
+            self.emit(f"Trig mode set to {env.mode}.")
+        elif name == "precision":
+            self.precision = max(1, min(max_precision(env.numbers), value))
+            env.set_precision(self.precision)
+            self.emit(f"Precision set to {self.precision}.")
+        elif name == "timeout":
+            env.limits.timeout = value
+            self.emit("Time limit disabled." if value is None
+                      else f"Time limit set to {value:g} s.")
+        elif name == "intbits":
+            env.set_int_bits(value)
+            self.emit("Integer size limit disabled." if value is None
+                      else f"Integer size limit set to {value} bits.")
+        elif name == "budget":
+            env.budget = value
+            self.emit("Cost budget disabled." if value is None
+                      else f"Cost budget set to {value:.3g} bits.")
+        else:  # reset
+            env.reset()
+            self.precision = 12
+            self.history.clear()
+            self.emit("State reset.")
+
+    def write_full(self, path: str):
+        # Every digit of ans, without the int string-length limit; str, not
+        # repr, so a Decimal is written as its digits
+        value = self.env.ans
+        if not path:
+            if type(value) is int:
+                write_int(value, self.out)
+            else:
+                self.emit(str(value))
+            return
+        try:
+            with open(path, "w", encoding="utf-8") as f:
+                if type(value) is int:
+                    write_int(value, f)
+                else:
+                    f.write(str(value) + "\n")
+        except OSError as e:
+            self.error(f"Cannot write {path}: {e.strerror}")
+            return
+        self.emit(f"Wrote ans to {path}.")
+
+    def record(self, line: str, value: Any):
+        # Store an evaluated line as the new ans and print it
+        if not isinstance(value, NUMBER_TYPES):
+            raise ValueError("Expression did not produce a number.")
+        self.env.ans = self.env.result(value)
+        self.history.append((line, self.env.ans))
+        self.show_result(self.env.ans)
+
+def describe_error(e: BaseException) -> str:
+    if isinstance(e, ZeroDivisionError):
+        return "division by zero."
+    if isinstance(e, (OverflowError, decimal.Overflow)):
+        return "numeric overflow."
+    if isinstance(e, decimal.InvalidOperation):
+        return "math domain error."
+    return str(e)
+
+_COMMANDS = ("quit", "exit", "help", "history", "mr", "mc", "cache", "reset", "jobs", "wait", "kill",
+             "bg", "full")
+_COMMAND_PREFIXES = ("clear", "mode", "precision", "m+", "m-", "budget", "timeout", "intbits",
+                     "bg ", "wait ", "kill ", "full ")
+
+_SETTINGS = {
+    "mode": f"Usage: mode {'|'.join((*TRIG_MODES, *NUMBER_MODES))}",
+    "precision": "Usage: precision N",
+    "timeout": "Usage: timeout SECONDS|off",
+    "intbits": "Usage: intbits N|off",
+    "budget": "Usage: budget N|off",
+}
+
+def parse_setting(line: str) -> tuple | None:
+    """
+    (name, value) for a line that changes how later lines evaluate: mode,
+    precision, timeout, intbits, budget or reset. None for any other line;
+    a malformed setting raises ValueError with its usage. The session and
+    the parallel batch's mode tracking both read settings through here.
+    """
+    lower = line.strip().lower()
+    if lower == "reset":
+        return "reset", None
+    name = next((n for n in _SETTINGS if lower.startswith(n)), None)
+    if name is None:
+        return None
+    parts = lower.split()
+    arg = parts[1] if len(parts) == 2 else ""
+    if name == "mode" and arg in (*TRIG_MODES, *NUMBER_MODES):
+        return name, arg
+    if name == "precision" and arg.isdigit():
+        return name, int(arg)
+    if name in ("timeout", "intbits", "budget") and arg == "off":
+        return name, None
+    if name == "intbits" and arg.isdigit():
+        return name, int(arg)
+    if name == "budget" and arg.isdigit():
+        return name, float(arg)
+    if name == "timeout":
+        try:
+            seconds = float(arg)
+        except ValueError:
+            seconds = 0.0
+        if seconds > 0:
+            return name, seconds
+    raise ValueError(_SETTINGS[name])
+
+def is_command(line: str) -> bool:
+    lower = line.strip().lower()
+    return lower in _COMMANDS or lower.startswith(_COMMAND_PREFIXES)
+
+def run_batch(lines: Iterable[str], out) -> int:
+    # No prompts or banner; ans/mem/mode carry over from line to line
+    session = Session(out)
+    for line in lines:
+        if not session.execute(line):
+            break
+    return 1 if session.errors else 0
+
+# ---------------- PARALLEL BATCH ---------------- #
+
+_worker_envs: Dict[tuple, Env] = {}
+
+def _init_worker():
+    # Ctrl+C goes to the parent, which shuts the pool down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+def _evaluate_chunk(chunk: list) -> list:
+    # Runs in a worker process; each worker keeps one warm Env per mode.
+    # Lines that read session state (ans, mem, jobN) or do not parse come
+    # back as None, for the session to run in order.
+    results: list = []
+    for mode, line in chunk:
+        try:
+            independent = _names_in(expr_cache.get(line)) <= CONSTANTS.keys()
+        except Exception:
+            independent = False
+        if not independent:
+            results.append(None)
+            continue
+        env = _worker_envs.get(mode)
+        if env is None:
+            trig, numbers, precision, budget, timeout, max_int_bits = mode
+            env = _worker_envs[mode] = Env(trig, numbers=numbers, precision=precision)
+            env.budget = budget
+            env.limits.timeout = timeout
+            env.limits.max_int_bits = max_int_bits
+        try:
+            results.append((env.evaluate(line), None))
+        except Exception as e:
+            results.append((None, describe_error(e)))
+    return results
+
+def _session_mode(session: Session) -> tuple:
+    # Everything a worker needs to evaluate a line as the session would:
+    # (trig mode, number mode, precision, budget, timeout, intbits)
+    env = session.env
+    return (env.mode, env.numbers.name, session.precision, env.budget,
+            env.limits.timeout, env.limits.max_int_bits)
+
+def _mode_after(line: str, mode: tuple) -> tuple:
+    # The _session_mode in effect after line, as Session.apply_setting
+    # would leave it
+    try:
+        setting = parse_setting(line)
+    except ValueError:
+        return mode
+    if setting is None:
+        return mode
+    name, value = setting
+    if name == "reset":
+        defaults = Limits()
+        return ("rad", "float", 12, DEFAULT_COST_BUDGET, defaults.timeout, defaults.max_int_bits)
+    trig, numbers, precision, budget, timeout, max_int_bits = mode
+    if name == "mode" and value in TRIG_MODES:
+        trig = value
+    elif name == "mode":
+        numbers = value
+        precision = min(precision, max_precision(NUMBER_MODES[value]))
+    elif name == "precision":
+        precision = max(1, min(max_precision(NUMBER_MODES[numbers]), value))
+    elif name == "budget":
+        budget = value
+    elif name == "intbits":
+        max_int_bits = value
+    else:  # timeout
+        timeout = value
+    return (trig, numbers, precision, budget, timeout, max_int_bits)
+
+def run_parallel_batch(lines: Iterable[str], out, jobs: int, chunk_size: int = 1024) -> int:
+    """
+    Like run_batch, but lines that are plain expressions not using ans, mem
+    or job results are evaluated in chunks on a pool of worker processes,
+    under the modes and limits in effect at that line. Every line that is
+    not a command goes to the workers as text, and the workers parse it;
+    the ones that read session state come back and run in order in this
+    process, as do commands. Output order always matches input order; the
+    next block is already queued while one merges.
+    """
+    from collections import deque
+    from concurrent.futures import ProcessPoolExecutor
+    session = Session(out)
+    block_size = chunk_size * jobs * 2
+    lines = iter(lines)
+    mode = _session_mode(session)
+
+    def submit(pool, block: list):
+        # Mode in effect at each line; commands never leave this process
+        nonlocal mode
+        work: list = []
+        slots: list = []
+        for line in block:
+            expression = bool(line) and not is_command(line)
+            slots.append(len(work) if expression else None)
+            if expression:
+                work.append((mode, line))
+            else:
+                mode = _mode_after(line, mode)
+        chunks = [work[i:i + chunk_size] for i in range(0, len(work), chunk_size)]
+        return block, slots, [pool.submit(_evaluate_chunk, c) for c in chunks]
+
+    def merge(block: list, slots: list, futures: list) -> bool:
+        results = [r for f in futures for r in f.result()]
+        for line, slot in zip(block, slots):
+            # Commands, and lines the workers handed back
+            if slot is None or results[slot] is None:
+                if not session.execute(line):
+                    return False
+                continue
+            value, err = results[slot]
+            try:
+                if err is not None:
+                    raise ValueError(err)
+                session.record(line, value)
+            except Exception as e:
+                session.error(f"Error: {e}")
+        return True
+
+    pool = ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker)
+    try:
+        pending: deque = deque()
+        while True:
+            block = [line.strip() for line in itertools.islice(lines, block_size)]
+            if block:
+                pending.append(submit(pool, block))
+                if len(pending) < 2:
+                    continue
+            if not pending or not merge(*pending.popleft()):
+                break
+    finally:
+        # Also reached on Ctrl+C: drop queued chunks instead of finishing them
+        pool.shutdown(cancel_futures=True)
+    return 1 if session.errors else 0
+
+def _names_in(tree: ast.AST) -> set:
+    return scan_tree(tree)[1]
+
+def run_csv(source, out, expr: str, where: str | None = None, column: str = "result",
+            mode: str = "rad", precision: int = 12) -> int:
+    """
+    Stream CSV rows from source to out, binding each column to its header
+    name and appending expr's value as a new column. With where, only rows
+    for which that expression is non-zero are written. Rows are processed
+    one at a time, so memory stays constant regardless of input size. Each
+    row runs under the same limits and cost budget as a session line.
+    """
+    reader = csv.reader(source)
+    writer = csv.writer(out, lineterminator="\n")
+    try:
+        header = next(reader)
+    except StopIteration:
+        return 0
+    writer.writerow([*header, column])
+
+    env = Env(mode)
+    constants = {k: v for k, v in CONSTANTS.items() if k not in header}
+    trees = [expr_cache.get(expr)] + ([expr_cache.get(where)] if where else [])
+    value_fn = compile_expr(trees[0], env.funcs, constants, env.limits, env.numbers)
+    where_fn = compile_expr(trees[1], env.funcs, constants, env.limits, env.numbers) if where else None
+    # Column values change per row, so the estimate cannot be cached
+    costly = [tree for tree in trees if may_be_expensive(tree)]
+    # Only convert the columns the expressions actually reference
+    used = set().union(*map(_names_in, trees))
+    bindings = [(i, name) for i, name in enumerate(header) if name in used]
+    scope = dict(env.names)
+    errors = 0
+
+    def bound(rows):
+        for row in rows:
+            try:
+                for i, name in bindings:
+                    scope[name] = float(row[i])
+            except (ValueError, IndexError):
+                yield row, None
+                continue
+            yield row, scope
+
+    def evaluated(pairs):
+        nonlocal errors
+        for row, names in pairs:
+            try:
+                if names is None:
+                    raise ValueError("non-numeric or missing column value")
+                if env.budget is not None:
+                    for tree in costly:
+                        check_cost(tree, names, env.budget, env.numbers)
+                if where_fn is not None and not evaluate_limited(where_fn, names, env.limits):
+                    continue
+                value = check_real(evaluate_limited(value_fn, names, env.limits), env.numbers)
+                yield [*row, format_result(value, precision)]
+            except Exception:
+                errors += 1
+                yield [*row, ""]
+
+    writer.writerows(evaluated(bound(reader)))
+    if errors:
+        print(f"{errors} row(s) could not be evaluated.", file=sys.stderr)
+    return 1 if errors else 0
+
+def interactive():
+    session = Session()
+    print("Advanced Calculator. Type 'help' for commands. Ctrl+C to exit.\n")
+
+    while True:
+        try:
+            line = input("> ")
+        except (EOFError, KeyboardInterrupt):
+            print("\nBye.")
+            break
+        try:
+            if not session.execute(line):
+                print("Bye.")
+                break
+        except KeyboardInterrupt:
+            # Cancels only the running line; ans, mem and history are untouched
+            print("\nInterrupted.")
+
+def _open_input(parser, path: str):
+    if path == "-":
+        return sys.stdin
+    try:
+        return open(path, encoding="utf-8", newline="")
+    except OSError as e:
+        parser.error(f"cannot read {path}: {e.strerror}")
+
+def main(argv: list | None = None) -> int:
+    import argparse
+    parser = argparse.ArgumentParser(description="Advanced command-line calculator.")
+    parser.add_argument("-e", "--expr", action="append", default=[], metavar="EXPR",
+                        help="evaluate EXPR (repeatable) and exit")
+    parser.add_argument("-f", "--file", metavar="FILE",
+                        help="evaluate each line of FILE ('-' for stdin) and exit")
+    parser.add_argument("--csv", metavar="FILE",
+                        help="evaluate the -e expression once per row of a CSV file ('-' for stdin)")
+    parser.add_argument("--where", metavar="EXPR",
+                        help="with --csv, keep only rows where EXPR is non-zero")
+    parser.add_argument("--column", default="result", metavar="NAME",
+                        help="with --csv, name of the output column (default: result)")
+    parser.add_argument("--mode", choices=("rad", "deg"), default="rad",
+                        help="with --csv, trig mode (default: rad)")
+    parser.add_argument("--precision", type=int, default=12, metavar="N",
+                        help="with --csv, digits printed per result (default: 12)")
+    parser.add_argument("-j", "--jobs", type=int, default=1, metavar="N",
+                        help="in batch mode, evaluate independent lines on N worker processes")
+    args = parser.parse_args(argv)
+
+    if args.csv:
+        if len(args.expr) != 1 or args.file:
+            parser.error("--csv needs exactly one -e EXPR and no -f")
+        source = _open_input(parser, args.csv)
+        precision = max(1, min(50, args.precision))
+        return _run_buffered(lambda out: run_csv(source, out, args.expr[0], args.where,
+                                                 args.column, args.mode, precision),
+                             source, newline="")
+
+    if args.expr or args.file or not sys.stdin.isatty():
+        return _run_batch_main(parser, args)
+
+    interactive()
+    return 0
+
+def _run_batch_main(parser, args) -> int:
+    lines: Iterable[str] = args.expr
+    source = None
+    if args.file or not args.expr:
+        source = _open_input(parser, args.file or "-")
+        lines = itertools.chain(lines, source)
+    if args.jobs > 1:
+        return _run_buffered(lambda out: run_parallel_batch(lines, out, args.jobs), source)
+    return _run_buffered(lambda out: run_batch(lines, out), source)
+
+def _run_buffered(run: Callable[[Any], int], source=None, newline: str | None = None) -> int:
+    # Runs a non-interactive mode with one large output buffer instead of a
+    # flush per result line. Ctrl+C stops it as it stops a REPL line: what
+    # was written so far is kept, and the exit status says it was cut short.
+    try:
+        with open(sys.stdout.fileno(), "w", buffering=1 << 20, closefd=False,
+                  newline=newline) as out:
+            return run(out)
+    except KeyboardInterrupt:
+        print("Interrupted.", file=sys.stderr)
+        return 130
+    finally:
+        if source is not None and source is not sys.stdin:
+            source.close()
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,12 @@
+import importlib.util
+import pathlib
+import sys
+
+# The calculator is a single script whose file name is not importable;
+# load it once as the module "calculator" for every test
+SCRIPT = pathlib.Path(__file__).resolve().parent.parent / "# simple calculator.py"
+
+spec = importlib.util.spec_from_file_location("calculator", SCRIPT)
+calculator = importlib.util.module_from_spec(spec)
+sys.modules["calculator"] = calculator
+spec.loader.exec_module(calculator)
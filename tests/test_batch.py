@@ -0,0 +1,72 @@
+import subprocess
+import sys
+
+import calculator as calc
+from conftest import SCRIPT
+
+
+def calculator(*args, stdin=""):
+    done = subprocess.run([sys.executable, str(SCRIPT), *args], input=stdin,
+                          capture_output=True, text=True, timeout=120)
+    return done.returncode, done.stdout.splitlines()
+
+
+def test_expressions_from_the_command_line():
+    assert calculator("-e", "2^10", "-e", "ans/4") == (0, ["1024", "256"])
+
+
+def test_stdin_keeps_ans_mem_and_modes():
+    lines = "2^3\nm+\nans*mem\nmode deg\nsin(90)\n"
+    code, out = calculator(stdin=lines)
+    assert code == 0
+    assert out == ["8", "Memory = 8.0", "64", "Trig mode set to deg.", "1"]
+
+
+def test_file_input_and_error_status(tmp_path):
+    path = tmp_path / "lines.txt"
+    path.write_text("1+1\n1/0\n\n3*3\n")
+    code, out = calculator("-f", str(path))
+    assert code == 1
+    assert out == ["2", "Error: division by zero.", "9"]
+
+
+def test_csv_binds_columns_and_filters():
+    data = "name,price,qty\na,2.5,4\nb,10,1\nc,x,2\n"
+    code, out = calculator("--csv", "-", "-e", "price*qty", stdin=data)
+    assert code == 1  # row c is not numeric
+    assert out == ["name,price,qty,result", "a,2.5,4,10", "b,10,1,10", "c,x,2,"]
+    code, out = calculator("--csv", "-", "-e", "sqrt(price)", "--where", "qty-1",
+                           "--column", "root", "--precision", "3",
+                           stdin="name,price,qty\na,2.5,4\nb,10,1\n")
+    assert (code, out) == (0, ["name,price,qty,root", "a,2.5,4,1.58"])
+
+
+def test_csv_columns_shadow_constants():
+    code, out = calculator("--csv", "-", "-e", "e*2", stdin="e\n1\n")
+    assert out == ["e,result", "1,2"]
+
+
+def test_parallel_output_matches_serial():
+    lines = "\n".join([
+        "5", "2ans", "3ANS+1", "m+ 4", "2mem", "sqrt(16)", "mode deg", "sin(30)",
+        "mode int", "2^70", "budget 10", "floor(2)^floor(100)", "budget off", "intbits 1000", "3^70000",
+        "reset", "2^70", "1/0", "nosuchname", "(1+",
+    ] + [f"{i}*{i}" for i in range(50)]) + "\n"
+    serial = calculator(stdin=lines)
+    assert calculator("-j", "2", stdin=lines) == serial
+    out = serial[1]
+    assert out[:5] == ["5", "10", "31", "Memory = 4.0", "8"]
+    assert out[11].startswith("Error: expression too expensive")
+    assert out[14].startswith("Error: integer result would need")
+
+
+def test_ctrl_c_keeps_csv_rows_written_so_far(capfd):
+    def rows():
+        yield from ("x\n", "1\n", "2\n")
+        raise KeyboardInterrupt
+
+    code = calc._run_buffered(lambda out: calc.run_csv(rows(), out, "x*2"), newline="")
+    out, err = capfd.readouterr()
+    assert code == 130
+    assert out.splitlines() == ["x,result", "1,2", "2,4"]
+    assert err == "Interrupted.\n"
@@ -0,0 +1,109 @@
+import ast
+import math
+
+import pytest
+
+import calculator as calc
+
+
+def run(expr, names=None, mode="rad"):
+    env_names, funcs = calc.build_env(calc.TrigMode(mode), 0.0, 0.0)
+    env_names.update(names or {})
+    return calc.compile_expr(calc.parse_expr(expr), funcs)(env_names)
+
+
+def test_operators_and_precedence():
+    assert run("1+2*3") == 7
+    assert run("2^3^2") == 512
+    assert run("-2^2") == -4
+    assert run("7//2 + 7%2") == 4
+
+
+def test_names_are_read_at_call_time():
+    names, funcs = calc.build_env(calc.TrigMode("rad"), 0.0, 0.0)
+    fn = calc.compile_expr(calc.parse_expr("ans*2+mem"), funcs)
+    names.update(ans=3.0, mem=1.0)
+    assert fn(names) == 7
+    names["ans"] = 10.0
+    assert fn(names) == 21
+
+
+def test_functions_follow_trig_mode():
+    assert run("sin(pi/2)") == pytest.approx(1.0)
+    assert run("sin(90)", mode="deg") == pytest.approx(1.0)
+    assert run("atan(1)", mode="deg") == pytest.approx(45.0)
+
+
+def test_unknown_names_and_functions():
+    with pytest.raises(NameError):
+        run("x+1")
+    with pytest.raises(NameError):
+        run("frobnicate(1)")
+
+
+def test_disallowed_nodes_are_rejected():
+    tree = ast.Expression(body=ast.Attribute(value=ast.Name(id="math", ctx=ast.Load()),
+                                             attr="pi", ctx=ast.Load()))
+    with pytest.raises(ValueError):
+        calc.Compiler({}).compile(tree)
+
+
+def test_safe_eval():
+    names, funcs = calc.build_env(calc.TrigMode("rad"), 2.0, 0.0)
+    assert calc.safe_eval("ans^2 + sqrt(16)", names, funcs) == 8
+    assert math.isclose(calc.safe_eval("ln(e)", names, funcs), 1.0)
+
+
+def test_safe_eval_reuses_compiled_expressions():
+    names, funcs = calc.build_env(calc.TrigMode("rad"), 1.0, 0.0)
+    for ans in (1.0, 2.0, 3.0):
+        names["ans"] = ans
+        assert calc.safe_eval("ans*10+1", names, funcs) == ans * 10 + 1
+    cache = calc._compiled_tables[id(funcs)][1]
+    assert (cache.misses, cache.hits) == (1, 2)
+    # Another table gets its own closures
+    other_names, other_funcs = calc.build_env(calc.TrigMode("deg"), 0.0, 0.0)
+    assert calc.safe_eval("sin(90)", other_names, other_funcs) == pytest.approx(1.0)
+
+
+def test_safe_eval_walks_text_used_once(monkeypatch):
+    compiled = []
+    real = calc.compile_expr
+    monkeypatch.setattr(calc, "compile_expr", lambda *a, **k: compiled.append(a) or real(*a, **k))
+    for ans in (1.0, 2.0):
+        # The original pattern: a fresh table for every call
+        names, funcs = calc.build_env(calc.TrigMode("rad"), ans, 0.0)
+        assert calc.safe_eval("ans*10+factorial(200)/factorial(199)", names, funcs) == ans * 10 + 200
+    assert compiled == []
+    assert calc.safe_eval("ans*10+factorial(200)/factorial(199)", names, funcs) == 220
+    assert len(compiled) == 1  # compiled on the table's second use
+
+
+def test_env_compiles_only_repeated_lines(monkeypatch):
+    compiled = []
+    real = calc.compile_expr
+    monkeypatch.setattr(calc, "compile_expr", lambda *a, **k: compiled.append(a) or real(*a, **k))
+    env = calc.Env()
+    for i in range(5):
+        assert env.evaluate(f"{i}*2+1") == i * 2 + 1
+    assert compiled == []
+    assert env.evaluate("3*2+1") == 7
+    assert len(compiled) == 1
+
+
+@pytest.mark.parametrize("numbers", ["float", "int", "exact"])
+def test_tree_walker_matches_compiler(numbers):
+    mode = calc.NUMBER_MODES[numbers]
+    names, funcs = calc.build_env(calc.TrigMode("rad"), 0.0, 0.0, numbers)
+    for expr in ("2^64+1", "7/2", "6/3", "1/3+1/6", "7//2*3%5", "-2^2"):
+        tree = calc.parse_expr(expr)
+        walked = calc.SafeEval(names, funcs, mode).visit(tree)
+        compiled = calc.compile_expr(tree, funcs, numbers=mode)(names)
+        assert type(walked) is type(compiled) and walked == compiled, expr
+
+
+def test_tree_walker_keeps_integers_exact():
+    names, funcs = calc.build_env(calc.TrigMode("rad"), 0.0, 0.0, "int")
+    walker = calc.SafeEval(names, funcs, calc.NUMBER_MODES["int"])
+    assert walker.visit(calc.parse_expr("2^64+1")) == 2**64 + 1
+    assert walker.visit(calc.parse_expr("7/2")) == 3.5
@@ -0,0 +1,91 @@
+import io
+import math
+
+import pytest
+
+import calculator as calc
+
+
+def compiled(expr, limits, numbers="int"):
+    _, funcs = calc.build_env(calc.TrigMode("rad"), 0.0, 0.0, numbers)
+    return calc.compile_expr(calc.parse_expr(expr), funcs, limits=limits,
+                             numbers=calc.NUMBER_MODES[numbers])
+
+
+def test_step_limit():
+    limits = calc.Limits(max_steps=300)
+    names = {f"x{i}": i for i in range(400)}
+    groups = ("(" + "+".join(list(names)[i:i + 20]) + ")" for i in range(0, 400, 20))
+    fn = compiled("+".join(groups), limits)
+    with pytest.raises(calc.LimitExceeded, match="step limit"):
+        calc.evaluate_limited(fn, names, limits)
+    assert calc.evaluate_limited(compiled("ans+1", limits), {"ans": 1}, limits) == 2
+
+
+def test_timeout_stops_big_integer_work():
+    limits = calc.Limits(timeout=0.0)
+    with pytest.raises(calc.LimitExceeded, match="time limit"):
+        calc.evaluate_limited(compiled("ans^2000000", limits), {"ans": 3}, limits)
+
+
+def test_integer_size_cap():
+    limits = calc.Limits(max_int_bits=1000)
+    with pytest.raises(calc.MemoryLimitExceeded):
+        calc.evaluate_limited(compiled("ans^1200", limits), {"ans": 2}, limits)
+
+
+def test_csv_rows_respect_the_cost_budget(capsys):
+    out = io.StringIO()
+    status = calc.run_csv(io.StringIO("price\n9\n2\n"), out, "floor(price)^floor(price)^floor(price)")
+    assert status == 1
+    assert out.getvalue().splitlines() == ["price,result", "9,", "2,16"]
+    assert "1 row(s) could not be evaluated." in capsys.readouterr().err
+
+
+def test_products_and_folded_constants_respect_the_cap():
+    buffer = io.StringIO()
+    session = calc.Session(buffer)
+    for line in ("mode int", "intbits 1000", "2^900", "ans*ans", "2^1200", "factorial(400)",
+                 "2^600*2^600", "intbits off", "2^1200"):
+        session.execute(line)
+    out = buffer.getvalue().splitlines()
+    assert out[3].startswith("Error: integer result would need")
+    assert all(line.startswith("Error: integer result would need") for line in out[4:7])
+    assert out[8].startswith("172184794563")
+
+
+@pytest.mark.parametrize("expr, value", [
+    ("sin(1)", math.sin(1)), ("exp(1.5)", math.exp(1.5)), ("log(3)", math.log(3)),
+    ("atan(0.3)", math.atan(0.3)),
+])
+def test_series_watch_the_deadline(expr, value):
+    env = calc.Env(numbers="decimal", precision=2000)
+    env.limits.timeout = 0.0
+    with pytest.raises(calc.LimitExceeded, match="time limit"):
+        env.evaluate(expr)
+    env.limits.timeout = None
+    assert float(env.evaluate(expr)) == pytest.approx(value)
+
+
+def test_ctrl_c_cancels_the_running_line(monkeypatch, capsys):
+    # SIGINT lands while the power runs in its child process; the REPL
+    # reports it and carries on with ans as it was
+    import os
+    import signal
+    import threading
+
+    lines = iter(["2+3", "budget off", "intbits off", "timeout off", "mode int",
+                  "3^100000000", "ans+1"])
+
+    def fake_input(prompt=""):
+        line = next(lines, None)
+        if line is None:
+            raise EOFError
+        if line.startswith("3^"):
+            threading.Timer(0.5, os.kill, (os.getpid(), signal.SIGINT)).start()
+        return line
+
+    monkeypatch.setattr("builtins.input", fake_input)
+    calc.interactive()
+    out = capsys.readouterr().out.splitlines()
+    assert out[-5:] == ["", "Interrupted.", "6", "", "Bye."]
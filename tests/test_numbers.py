@@ -0,0 +1,129 @@
+import math
+import sys
+from fractions import Fraction
+
+import calculator as calc
+from test_session import run
+
+
+def digits(n):
+    # Reference decimal text, past the int string limit
+    limit = sys.get_int_max_str_digits()
+    sys.set_int_max_str_digits(0)
+    try:
+        return str(n)
+    finally:
+        sys.set_int_max_str_digits(limit)
+
+
+def test_int_mode_keeps_integers_exact():
+    out, session = run("mode int", "2^64+1", "7/2", "6/3", "factorial(30)")
+    assert out[1:] == [str(2**64 + 1), "3.5", "2", str(math.factorial(30))]
+    assert type(session.env.ans) is int
+
+
+def test_long_integers_show_exact_leading_digits():
+    text = digits(math.factorial(2000))
+    out, _ = run("mode int", "factorial(2000)", "mode decimal", "precision 200", "history")
+    assert out[1] == f"{text[:12]}...{text[-12:]} (5736 digits)"
+    assert out[-1].endswith(f"{text[:40]}...{text[-40:]} (5736 digits)")
+
+
+def test_round_integers_keep_their_leading_digits():
+    for n in (15 * 10**399, 2 * 10**1000, 123456789 * 10**3000, 15 * 10**399 - 1):
+        text = digits(n)
+        assert calc.int_digits(n, 12) == (len(text), text[:12])
+
+
+def test_long_integers_in_full_past_the_string_limit():
+    out, _ = run("mode int", "factorial(2000)", "mode decimal", "precision 5000", "history")
+    assert out[-1].endswith(digits(math.factorial(2000)))
+
+
+def test_exact_mode_keeps_fractions():
+    out, session = run("mode exact", "1/3+1/6", "0.1*3", "2^-3", "3", "ans!/(ans+2)!", "5!/3!")
+    assert out[1:] == ["1/2", "3/10", "1/8", "3", "1/20", "20"]
+    assert type(session.env.ans) is int
+
+
+def test_exact_mode_reads_literals_at_their_text():
+    def exact(value):
+        return Fraction(value.num, value.den) if type(value) is calc.Rational else value
+
+    for text in ("0.12345678901234567890123", "1e-400", "1.5e400", "2.5e-3000"):
+        _, session = run("mode exact", text, text)  # walked, then compiled
+        assert exact(session.env.ans) == Fraction(text)
+    out, _ = run("mode exact", "0.1000000000000000000001 - 0.1")
+    assert out[1] == "1/10000000000000000000000"
+
+
+def test_decimal_mode_formats_past_the_string_limit():
+    out, session = run("mode decimal", "precision 5000", "10^4500", "1/3", "full")
+    assert out[2] == "1" + "0" * 4500
+    assert out[3] == "0." + "3" * 5000
+    assert out[4].startswith("0.3333") and "Decimal" not in out[4]
+    assert session.history[0][0] == "10^4500"
+
+
+def test_decimal_mode_precision():
+    out, _ = run("mode decimal", "precision 50", "sqrt(2)", "2*3", "-0")
+    assert out[2] == "1.4142135623730950488016887242096980785696718753769"
+    assert out[3:] == ["6", "0"]
+
+
+def test_decimal_mode_reads_literals_at_their_text():
+    out, _ = run("mode decimal", "precision 30", "0.12345678901234567890123",
+                 "1.5e400", "1.5e400", "1e-400*3")
+    assert out[2:] == ["0.12345678901234567890123", "1.5e+400", "1.5e+400", "3e-400"]
+
+
+def test_decimal_history_and_memory_are_formatted():
+    out, _ = run("mode decimal", "2*10^20", "m+", "mr", "1/3", "history")
+    assert out[1:4] == ["2e+20", "Memory = 2e+20", "2e+20"]
+    assert out[-2:] == [" 1: 2*10^20  =  2e+20", " 2: 1/3  =  0.33333333333333333"]
+
+
+def test_long_division_matches_floor_division():
+    import random
+    rng = random.Random(7)
+    for a_bits, b_bits in ((100, 90), (200_000, 100_000), (300_000, 40_000), (60_000, 60_000)):
+        a, b = rng.getrandbits(a_bits), rng.getrandbits(b_bits) | 1
+        for n in (a, -a, a - a % b, b * b):
+            assert calc._long_divide(n, b) == n // b
+
+
+def test_adaptive_mode_refines_only_uncertain_results():
+    out, session = run("mode adaptive", "(1e16+1)-1e16", "0.1+0.2", "sqrt(2)")
+    assert out[1:] == ["1", "0.3", "1.41421356237"]
+    assert type(session.env.ans) is float
+
+
+def test_adaptive_refinement_reads_ans_and_literals_past_float():
+    out, _ = run("mode adaptive", "0.1", "ans+1e16-1e16", "m+", "mem*3+1e16-1e16",
+                 "1e-400*1e400", "1.5e400/3")
+    assert out[1:] == ["0.1", "0.1", "Memory = 0.1", "0.3", "1", "5e+399"]
+
+
+def test_complex_mode_and_leaving_it():
+    out, session = run("mode complex", "sqrt(-4)", "m+", "(1+2j)*(1-2j)", "log(-1)",
+                       "mode float", "ans+mem+1", "2ans")
+    assert out[1:5] == ["2j", "Memory = 2j", "5", "3.14159265359j"]
+    assert out[5:] == ["Number mode set to float.", "Complex ans and mem reset to 0.", "1", "2"]
+    assert session.env.mem == 0
+
+
+def test_complex_results_only_in_complex_mode():
+    for mode in ("float", "int", "exact", "adaptive"):
+        out, _ = run(f"mode {mode}", "(-8)^(1/3)")
+        assert out[1] == "Error: math domain error"
+    out, _ = run("mode exact", "1/3", "mode complex", "ans*1j",
+                 "mode decimal", "1/4", "mode complex", "ans*1j")
+    assert out[3] == "0.333333333333j"
+    assert out[-1] == "0.25j"
+
+
+def test_memory_errors_do_not_escape():
+    _, session = run("1")
+    session.env.mem = 1j
+    session.execute("m+ 1")
+    assert session.out.getvalue().splitlines()[-1].startswith("Memory op error:")
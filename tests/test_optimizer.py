@@ -0,0 +1,84 @@
+import ast
+
+import calculator as calc
+
+
+def folded(expr, mode="rad"):
+    _, funcs = calc.build_env(calc.TrigMode(mode), 0.0, 0.0)
+    return calc.fold_constants(calc.parse_expr(expr), funcs).body
+
+
+def test_constant_subtrees_fold():
+    node = folded("2*pi/360")
+    assert isinstance(node, ast.Constant)
+    assert node.value == 2 * calc.math.pi / 360
+    assert folded("sqrt(2)/2").value == calc.math.sqrt(2) / 2
+    assert folded("10^-3").value == 10 ** -3
+
+
+def test_names_stay_symbolic():
+    node = folded("ans*(2+3)")
+    assert isinstance(node, ast.BinOp)
+    assert isinstance(node.left, ast.Name) and node.left.id == "ans"
+    assert node.right.value == 5
+
+
+def test_long_chains_fold_in_one_pass():
+    node = folded("+".join(["2^3"] * 200))
+    assert isinstance(node, ast.Constant) and node.value == 1600
+    assert not calc.builds_big_ints(calc.parse_expr("2^3 + 1").body)
+    assert calc.may_be_expensive(calc.parse_expr("2^3 + 1"))
+
+
+def test_factorial_ratios_stay_whole():
+    node = folded("factorial(2*5)/factorial(10^7)")
+    assert isinstance(node.left, ast.Call) and isinstance(node.right, ast.Call)
+    assert node.left.args[0].value == 10 and node.right.args[0].value == 10 ** 7
+
+
+def test_errors_are_left_for_evaluation():
+    assert isinstance(folded("1/0"), ast.BinOp)
+    assert isinstance(folded("sqrt(-1)"), ast.Call)
+
+
+def test_degree_trig_is_not_folded():
+    assert isinstance(folded("sin(1)"), ast.Constant)
+    assert isinstance(folded("sin(90)", mode="deg"), ast.Call)
+
+
+def test_input_tree_is_not_modified():
+    tree = calc.parse_expr("1+2")
+    before = ast.dump(tree)
+    calc.fold_constants(tree, calc.build_env(calc.TrigMode("rad"), 0.0, 0.0)[1])
+    assert ast.dump(tree) == before
+
+
+def test_repeated_subtrees_share_a_slot():
+    tree = calc.parse_expr("sin(ans)^2 + cos(ans)^2 + sin(ans)*cos(ans)")
+    shared = calc.common_subexpressions(tree)
+    assert len(set(shared.values())) == 2  # sin(ans) and cos(ans)
+    assert len(shared) == 4
+
+
+def test_shared_subtrees_are_evaluated_once():
+    calls = []
+    def f(x):
+        calls.append(x)
+        return x + 1
+    funcs = {"f": f}
+    fn = calc.compile_expr(calc.parse_expr("f(ans)*f(ans) + f(ans)"), funcs)
+    assert fn({"ans": 2.0}) == 12
+    assert calls == [2.0]
+    # A fresh evaluation recomputes the slot
+    assert fn({"ans": 3.0}) == 20
+    assert calls == [2.0, 3.0]
+
+
+def test_single_occurrences_are_not_shared():
+    assert calc.common_subexpressions(calc.parse_expr("sin(ans) + cos(ans)")) == {}
+
+
+def test_signed_zeros_are_distinct():
+    _, funcs = calc.build_env(calc.TrigMode("rad"), 0.0, 0.0)
+    tree = calc.fold_constants(calc.parse_expr("1/(0.0*x) - 1/(-0.0*x)"), funcs)
+    assert calc.common_subexpressions(tree) == {}
@@ -0,0 +1,67 @@
+import ast
+
+import pytest
+
+import calculator as calc
+
+
+def value(expr, ans=0.0, mem=0.0):
+    names, funcs = calc.build_env(calc.TrigMode("rad"), ans, mem)
+    return calc.compile_expr(calc.parse_expr(expr), funcs)(names)
+
+
+def same_tree(a, b):
+    return ast.dump(calc.parse_expr(a)) == ast.dump(calc.parse_expr(b))
+
+
+@pytest.mark.parametrize("expr, expected", [
+    ("2^10", 1024),
+    ("2**10", 1024),
+    ("-3^2", -9),
+    ("2^-1", 0.5),
+    ("10 - 4 - 3", 3),
+    ("2*(3+4)", 14),
+])
+def test_operators(expr, expected):
+    assert value(expr) == expected
+
+
+def test_implicit_multiplication():
+    assert same_tree("2pi", "2*pi")
+    assert same_tree("2(3+4)", "2*(3+4)")
+    assert same_tree("(1+2)(3+4)", "(1+2)*(3+4)")
+    assert same_tree("3sin(1)", "3*sin(1)")
+    assert value("2ans", ans=5.0) == 10
+    # Binds like *, so 2^3pi is (2^3)*pi and 1/2pi is (1/2)*pi
+    assert same_tree("2^3pi", "(2^3)*pi")
+    assert same_tree("1/2pi", "(1/2)*pi")
+
+
+def test_case_insensitive_names_and_ln():
+    assert value("ANS + Mem", ans=2.0, mem=3.0) == 5
+    assert same_tree("ln(2)", "log(2)")
+    assert same_tree("LN(2)", "log(2)")
+
+
+def test_postfix_factorials():
+    assert value("5!") == 120
+    assert value("5!!") == 15
+    assert value("3!!!") == pytest.approx(value("factorial(factorial2(3))"))
+    assert value("((1+2)*3)!") == 362880
+    assert value("2^3!") == 64
+    assert value("-3!") == -6
+    assert value("ans!", ans=4.0) == 24
+
+
+def test_syntax_errors():
+    for expr in ("", "1+", "(1", "1)", "2 $ 3", "f(1,"):
+        with pytest.raises(SyntaxError):
+            calc.parse_expr(expr)
+
+
+def test_digit_separators():
+    assert value("1_000") == 1000
+    assert value("1_000.5e1_0") == 1000.5e10
+    for expr in ("1_", "1__0", "1._5"):
+        with pytest.raises(SyntaxError):
+            calc.parse_expr(expr)
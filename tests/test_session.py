@@ -0,0 +1,88 @@
+import io
+
+import pytest
+
+import calculator as calc
+
+
+def run(*lines):
+    out = io.StringIO()
+    session = calc.Session(out)
+    for line in lines:
+        session.execute(line)
+    return out.getvalue().splitlines(), session
+
+
+def test_env_switches_tables_and_keeps_state():
+    env = calc.Env("rad", ans=2.0, mem=1.0)
+    rad = env.funcs
+    env.set_mode("deg")
+    assert env.evaluate("sin(90)") == 1
+    env.set_mode("rad")
+    assert env.funcs is rad  # built once, swapped back
+    assert env.evaluate("ans+mem") == 3
+
+
+def test_cache_reports_compiled_expressions():
+    out, _ = run("1+1", "1+1", "1+1", "1+1", "cache")
+    assert out[:4] == ["2"] * 4
+    assert "Compiled (rad, float): 1/1024 entries, 3 hits, 1 misses, 0 evictions" in out
+
+
+def test_memory_and_history():
+    out, session = run("2^3", "m+", "m+ 2", "mr", "ans*mem", "history")
+    assert out[:5] == ["8", "Memory = 8.0", "Memory = 10.0", "10", "80"]
+    assert out[-2:] == [" 1: 2^3  =  8.0", " 2: ans*mem  =  80.0"]
+    assert session.env.ans == 80
+
+
+def test_budget_checks_literals_and_names():
+    out, _ = run("mode int", "budget 1000", "3^70000", "3^70000", "70000", "3^ans",
+                 "2^(1/3)", "budget off", "3^70")
+    assert out[2].startswith("Error:") and out[3] == out[2]  # cached estimate
+    assert out[5].startswith("Error:")  # estimated from ans at each run
+    assert out[6] == "1.25992104989"
+    assert out[8] == str(3**70)
+
+
+def test_factorial_ratios_survive_compilation():
+    # The second run of a line is compiled, with constants folded
+    out, _ = run(*["factorial(10)/factorial(10^7)"] * 2,
+                 *["factorial(10^7)/factorial(10^7-1)"] * 2)
+    assert out == ["0", "0", "10000000", "10000000"]
+
+
+def test_jobs_are_reported_once():
+    out, session = run("bg 2+3", "wait 1", "wait", "job1*2", "bg")
+    assert out[0] == "[1] started: 2+3"
+    assert out[1].startswith("[1] done") and out[1].endswith("=  5  (job1)")
+    assert out[2:] == ["10", "Usage: bg EXPR"]
+    out, _ = run("bg 2+3", "wait 1", "wait 1")  # an explicit wait shows it again
+    assert len(out) == 3 and out[2].endswith("=  5  (job1)")
+
+    out, session = run("bg 2+3")
+    session.jobs[1].conn.poll(30)  # ended, but not yet collected
+    session.execute("jobs")
+    lines = session.out.getvalue().splitlines()
+    assert len(lines) == 2 and lines[1].startswith("[1] done")
+
+
+def test_job_results_follow_the_number_mode():
+    out, _ = run("mode decimal", "bg 1/3", "wait 1", "mode float", "job1+1")
+    assert out[-1] == "1.33333333333"
+    out, _ = run("mode exact", "bg 1/3", "wait 1", "mode decimal", "mode float", "job1*3")
+    assert out[-1] == "1"
+
+
+def test_parallel_mode_tracking_reads_settings_like_the_session():
+    lines = ["mode DEG", "mode exact", "precision 80", "budget off", "intbits 64",
+             "timeout 2.5", "precision x", "timeout 0", "1+1"]
+    _, session = run(*lines)
+    mode = calc._session_mode(calc.Session(io.StringIO()))
+    for line in lines:
+        mode = calc._mode_after(line, mode)
+    assert mode == calc._session_mode(session)
+    assert calc.parse_setting("Mode Deg") == ("mode", "deg")
+    assert calc.parse_setting("mr") is None
+    with pytest.raises(ValueError, match="Usage: timeout"):
+        calc.parse_setting("timeout -1")
@@ -0,0 +1,39 @@
+import math
+
+import pytest
+
+import calculator as calc
+
+np = pytest.importorskip("numpy")
+
+
+def test_matches_scalar_evaluation():
+    x = [0.0, 0.5, 1.0, 2.0]
+    got = calc.vector_eval("sin(x)^2 + sqrt(x)*ans", {"x": x}, ans=2.0)
+    assert np.allclose(got, [math.sin(v) ** 2 + math.sqrt(v) * 2.0 for v in x])
+
+
+def test_domain_errors_are_per_element():
+    got = calc.vector_eval("sqrt(x) + log(x)", {"x": [-1.0, 1.0]})
+    assert math.isnan(got[0]) and got[1] == 1.0
+
+
+def test_factorial_uses_gamma_off_the_integers():
+    got = calc.vector_eval("factorial(x)", {"x": [0, 5, 0.5, -0.5, -1, 200]})
+    assert got[:2].tolist() == [1.0, 120.0]
+    assert np.allclose(got[2:4], [math.gamma(1.5), math.gamma(0.5)])
+    assert math.isnan(got[4]) and got[5] == math.inf
+    got = calc.vector_eval("x!!", {"x": [7, 0.5]})
+    assert got[0] == 105.0 and math.isnan(got[1])
+
+
+def test_signed_zeros_are_not_shared():
+    got = calc.vector_eval("1/(0.0*x) - 1/(-0.0*x)", {"x": [1.0]})
+    assert got.tolist() == [math.inf]
+
+
+def test_fallback_sees_only_non_integers():
+    seen = []
+    got = calc._vector_table_lookup(math.factorial, [1, 2, 2.5, 3],
+                                    lambda x: seen.append(x.size) or x * 0 - 1)
+    assert seen == [1] and got.tolist() == [1.0, 2.0, -1.0, 6.0]